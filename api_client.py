@@ -1,22 +1,203 @@
 import openai
+import hashlib
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
 from typing import Callable, Optional, List, Dict, Any
 
+from backends import Backend, BackendUnavailableError, LocalBackend, RemoteBackend, BACKEND_LOCAL, BACKEND_REMOTE, is_local_endpoint
+from cassette import RecordingBackend, ReplayBackend, CASSETTE_RECORD, CASSETTE_REPLAY
+from chunking import split_text
+from conversation import Conversation, MessageNode, Role
+from retrieval import ChatIndex, exchange_text, exchanges, format_context, text_digest
+from scheduler import Scheduler
+from singleflight import SingleFlight
+from stopping import StopMatcher, compile_stops
+
+# Map-reduce summarization of large inputs
+MAP_REDUCE_CHUNK_CHARS = 12000  # About 3k tokens per chunk
+MAP_REDUCE_WORKERS = 4  # Chunks summarized concurrently
+MAP_PROMPT = (
+    "This is part {index} of {total} of a longer text. "
+    "Extract everything relevant to the task below, as concise notes.\n\n"
+    "Task: {instruction}\n\n---\n{chunk}"
+)
+REDUCE_PROMPT = (
+    "{instruction}\n\n"
+    "The text was too long to send at once ({description}). "
+    "Below are notes taken from each part, in order.\n\n{notes}"
+)
+
+# Retries for transient failures before the first token arrives
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_S = 1.0
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+PROGRESS_INTERVAL_S = 0.25  # Minimum time between streaming progress reports
+MAX_COMPARE_MODELS = 4  # Models a comparison fans out to
+MAX_SERVER_STOP_SEQUENCES = 4  # OpenAI rejects more; the rest are matched client-side
+MAX_PENDING_EXCHANGES = 50  # Exchanges kept for the chat index while embedding keeps failing
+INDEX_FLUSH_TIMEOUT_S = 5.0  # Longest wait on exit for queued exchanges to be indexed
+# Request fields passed through for tools using the local proxy endpoint; other fields
+# go to remote endpoints as they are and are rejected by backends that cannot honor them
+PROXY_PARAMS = ('model', 'max_tokens', 'temperature', 'top_p', 'presence_penalty', 'frequency_penalty', 'stop', 'seed')
+PROXY_HANDLED = ('messages', 'stream', 'stream_options')  # Fields the proxy itself takes care of
+
+# Background compaction of old turns into a rolling summary
+COMPACT_MAX_TOKENS = 1024  # Longest summary requested
+COMPACT_PROMPT = (
+    "Update the running summary of a conversation between a user and an AI assistant. "
+    "Keep facts, decisions, names, numbers, code identifiers and open questions; "
+    "drop greetings and repetition. Reply with the updated summary only.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{turns}"
+)
+
+# Progress states reported while a request is running
+STATE_CONNECTING = 'connecting'
+STATE_WAITING = 'waiting'
+STATE_STREAMING = 'streaming'
+STATE_RETRYING = 'retrying'
+
+class ModelTarget:
+    """A model and endpoint that a comparison request is sent to"""
+    __slots__ = ('label', 'model', 'base_url', 'backend')
+
+    def __init__(self, label: str, model: str, base_url: str, backend: Backend):
+        self.label = label
+        self.model = model
+        self.base_url = base_url
+        self.backend = backend
+
+class EmptyResponseError(Exception):
+    """Raised when the API returns no choices"""
+
+class StreamInterruptedError(Exception):
+    """Raised when a stream fails after tokens were already shown"""
+
+class UnsupportedParamsError(Exception):
+    """Raised when a proxied request uses fields the active backend cannot honor"""
+    status_code = 400
+
+def _ignore_progress(state: str, detail: str):
+    pass
+
+def _ignore_delta(text: str):
+    pass
+
 class OpenAIClient:
     def __init__(self, config):
         self.config = config
-        self.conversation_history: List[Dict[str, str]] = []
+        self.conversation = Conversation()
         self.current_request_thread: Optional[threading.Thread] = None
-        self.terminate_request: bool = False
+        self.request_cancel = threading.Event()  # Set to terminate the current request; replaced per request
+        self.request_lock = threading.Lock()  # Orders a request's last write against the next request starting
+        self.backend: Optional[Backend] = None
+        self.backends: Dict[tuple, Optional[Backend]] = {}  # Backend settings -> backend
+        self.profile_backends: Dict[str, Optional[Backend]] = {}  # Profile name ('' for base) -> backend
+        self.compare_backends: Dict[str, Backend] = {}
+        self.last_usage: Dict[str, int] = {}
+        self.session_usage: Dict[str, int] = {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+        self.chat_index: Optional[ChatIndex] = ChatIndex(config.config_dir) if ChatIndex.available() else None
+        self.pending_exchanges: List[str] = []  # Finished exchanges not yet embedded
+        self.pending_lock = threading.Lock()
+        self.index_thread: Optional[threading.Thread] = None
+        self.compaction_cancel: Optional[threading.Event] = None  # Set while a compaction runs
+        self.flights = SingleFlight()  # Identical requests in flight share one upstream call
+        self.scheduler = Scheduler()  # Keeps background jobs out of the way of interactive requests
         self.update_config()
     
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """Messages payload for the current branch, flattened on demand"""
+        return self.conversation.messages()
+    
     def update_config(self):
-        """Update OpenAI configuration"""
-        api_key = self.config.get_api_key()
-        base_url = self.config.get_base_url()
-        if api_key:
-            openai.api_key = api_key
-            openai.base_url = base_url
+        """Build the backends of the base settings and of every profile.
+        
+        Profiles with the same endpoint (or local model) share a backend,
+        and backends whose settings did not change are kept along with
+        their warm connection pool or loaded model. In cassette record or
+        replay mode every backend is wrapped or replaced accordingly.
+        """
+        previous = self.backends
+        self.backends = {}
+        self.profile_backends = {}
+        cassette = self._cassette_settings()
+        for profile in [''] + self.config.get_profiles():
+            settings = self.config.get_backend_settings(profile) + cassette
+            if settings not in self.backends:
+                self.backends[settings] = previous[settings] if settings in previous else self._make_backend(settings)
+            self.profile_backends[profile] = self.backends[settings]
+        self.backend = self.profile_backends[self.config.get_active_profile()]
+        self.compare_backends = {}
+    
+    def _cassette_settings(self) -> tuple:
+        """Cassette mode, directory and replay time scale"""
+        return self.config.get_cassette_mode(), self.config.get_cassette_path(), self.config.get_cassette_time_scale()
+    
+    def _make_backend(self, settings: tuple) -> Optional[Backend]:
+        """Create the backend described by Config.get_backend_settings plus the cassette settings"""
+        kind, base_url, api_key, model_path, context_size, gpu_layers, mode, path, time_scale = settings
+        if mode == CASSETTE_REPLAY:
+            # No network or model needed
+            return ReplayBackend(Path(path), time_scale)
+        if kind == BACKEND_LOCAL:
+            backend = LocalBackend(model_path, context_size, gpu_layers)
+        elif api_key:
+            backend = RemoteBackend(base_url, api_key)
+        else:
+            return None
+        return RecordingBackend(backend, Path(path)) if mode == CASSETTE_RECORD else backend
+    
+    def select_profile(self, name: str):
+        """Switch to a profile; its backend already exists, so nothing is read or written"""
+        self.config.select_profile(name)
+        self.backend = self.profile_backends[name]
+    
+    def _remote_backend(self, base_url: str) -> Backend:
+        """Backend for another endpoint, with its own connection pool.
+        
+        The main API key is only sent to the main endpoint's host; other
+        hosts get their own key from [CompareKeys], or none.
+        """
+        if base_url not in self.compare_backends:
+            target = urlparse(base_url)
+            if target.netloc.lower() == urlparse(self.config.get_base_url()).netloc.lower():
+                api_key = self.config.get_api_key()
+            else:
+                api_key = self.config.get_compare_api_key(target.hostname or '')
+            settings = (BACKEND_REMOTE, base_url, api_key or 'not-needed', '', 0, 0)
+            self.compare_backends[base_url] = self._make_backend(settings + self._cassette_settings())
+        return self.compare_backends[base_url]
+    
+    def prewarm_async(self) -> bool:
+        """Warm up the backend in the background.
+        
+        Remote endpoints get a pooled connection with the handshakes done;
+        local models are loaded and the system prompt evaluated, so the
+        first real request only pays for the new tokens. Fires at most once
+        per configured interval; returns whether a pre-warm was started.
+        """
+        now = time.monotonic()
+        backend = self.backend
+        if backend is None or now - backend.last_warm < self.config.get_prewarm_interval():
+            return False
+        backend.last_warm = now
+        messages = self.build_messages()[:1] if self.config.get_system_prompt().strip() else []
+        params = self._request_params()
+        
+        def warm():
+            try:
+                with self.scheduler.background(threading.Event()) as admitted:
+                    if admitted:
+                        backend.warm(messages, params)
+            except Exception:
+                # Pre-warming is best effort; the real request reports errors
+                pass
+        
+        threading.Thread(target=warm, daemon=True).start()
+        return True
     
     def update_api_key(self, api_key: str):
         """Update API key and reinitialize client"""
@@ -28,10 +209,151 @@ class OpenAIClient:
         self.config.set_base_url(base_url)
         self.update_config()
     
+    def update_backend(self, backend: str, model_path: str):
+        """Select the remote or local backend and the local model file"""
+        self.config.set_backend(backend)
+        self.config.set_local_model_path(model_path)
+        self.update_config()
+    
     def update_model(self, model: str):
         """Update model"""
         self.config.set_model(model)
     
+    def _request_params(self, model: Optional[str] = None, base_url: Optional[str] = None) -> Dict[str, Any]:
+        """Model and sampling parameters shared by every completion request"""
+        model = model or self.config.get_model()
+        stop = self._parse_stop_sequences(self.config.get('OpenAI', 'stop', ''))
+        return {
+            'model': model,
+            'max_tokens': int(self.config.get('OpenAI', 'max_tokens', '4096')),
+            'temperature': float(self.config.get('OpenAI', 'temperature', '1.0')),
+            'top_p': float(self.config.get('OpenAI', 'top_p', '1.0')),
+            'presence_penalty': float(self.config.get('OpenAI', 'presence_penalty', '0.0')),
+            'frequency_penalty': float(self.config.get('OpenAI', 'frequency_penalty', '0.0')),
+            'stop': stop[:MAX_SERVER_STOP_SEQUENCES] if stop else None,
+            'extra_body': self._prefix_cache_params(model, base_url or self.config.get_base_url()) or None,
+        }
+    
+    def _retrying(self, call: Callable[[], Any], progress: Callable[[str, str], None],
+                  cancel: threading.Event) -> Any:
+        """Run call, retrying transient API failures with exponential backoff.
+        
+        Returns None without calling again once cancel is set, including
+        when it is set during a backoff wait.
+        """
+        for attempt in range(RETRY_ATTEMPTS):
+            if cancel.is_set():
+                return None
+            try:
+                return call()
+            except RETRYABLE_ERRORS:
+                if attempt == RETRY_ATTEMPTS - 1 or cancel.is_set():
+                    raise
+                progress(STATE_RETRYING, f"{attempt + 1}/{RETRY_ATTEMPTS - 1}")
+                cancel.wait(RETRY_BACKOFF_S * (2 ** attempt))
+        return None
+    
+    def _complete(self, messages: List[Dict[str, str]], cancel: threading.Event,
+                  progress: Callable[[str, str], None] = _ignore_progress) -> str:
+        """Run one blocking completion and return the reply text ('' if cancelled first)"""
+        def call():
+            response = self.flights.create(self.backend, messages, **self._request_params())
+            self._record_usage(getattr(response, 'usage', None))
+            if not response.choices:
+                raise EmptyResponseError("No response received from API.")
+            return (response.choices[0].message.content or '').strip()
+        
+        with self.scheduler.interactive():
+            return self._retrying(call, progress, cancel) or ''
+    
+    def _stream(self, messages: List[Dict[str, str]], progress: Callable[[str, str], None],
+                on_delta: Callable[[str], None], cancel: threading.Event,
+                target: Optional['ModelTarget'] = None) -> Optional[str]:
+        """Stream a completion, reporting each text delta as it arrives.
+        
+        Uses the configured model unless a comparison target is given.
+        Returns the full reply, or None if cancel was set. No delta is
+        reported after that.
+        """
+        parts: List[str] = []
+        backend = target.backend if target else self.backend
+        params = self._request_params(target.model, target.base_url) if target else self._request_params()
+        
+        def call():
+            progress(STATE_CONNECTING, "")
+            stream = self.flights.create(backend, messages, stream=True, **params)
+            first_token_at = None
+            last_report = 0.0
+            try:
+                # Inside the try, so the stream (and a local model's lock) is released if these raise
+                progress(STATE_WAITING, "")
+                matcher = self._stop_matcher()
+                for chunk in stream:
+                    if cancel.is_set():
+                        return None
+                    if getattr(chunk, 'usage', None):
+                        self._record_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    
+                    stopped = False
+                    if matcher is not None:
+                        # Text that may start a stop sequence comes out with a later chunk
+                        delta, stopped = matcher.feed(delta)
+                    if cancel.is_set():
+                        return None
+                    if delta:
+                        parts.append(delta)
+                        on_delta(delta)
+                    if stopped:
+                        # Closing the stream below makes the server stop generating
+                        break
+                    
+                    # Chunks are close enough to tokens for a rate display
+                    now = time.monotonic()
+                    if first_token_at is None:
+                        first_token_at = now
+                    if now - last_report >= PROGRESS_INTERVAL_S:
+                        last_report = now
+                        elapsed = now - first_token_at
+                        rate = f"{len(parts) / elapsed:.0f} tok/s" if elapsed > 0 else ""
+                        progress(STATE_STREAMING, rate)
+            except RETRYABLE_ERRORS as e:
+                if parts:
+                    # Text is already on screen; retrying would repeat it
+                    raise StreamInterruptedError(f"Connection lost while streaming: {e}")
+                raise
+            finally:
+                stream.close()
+            
+            tail = matcher.flush() if matcher is not None else ''
+            if cancel.is_set():
+                return None
+            if tail:
+                parts.append(tail)
+                on_delta(tail)
+            if not parts:
+                raise EmptyResponseError("No response received from API.")
+            return ''.join(parts).strip()
+        
+        with self.scheduler.interactive():
+            return self._retrying(call, progress, cancel)
+    
+    def _describe_error(self, e: Exception) -> str:
+        """Turn an API exception into a message for the user"""
+        if isinstance(e, openai.AuthenticationError):
+            return "Invalid API key. Please check your OpenAI API key."
+        if isinstance(e, openai.RateLimitError):
+            return "Rate limit exceeded. Please try again later."
+        if isinstance(e, (EmptyResponseError, StreamInterruptedError, BackendUnavailableError, UnsupportedParamsError)):
+            return str(e)
+        if "timeout" in str(e).lower():
+            return "API timeout. Please try again."
+        return f"Error: {str(e)}"
+    
     def _parse_stop_sequences(self, stop_str: str):
         """Parse stop sequences from config string"""
         if not stop_str or not stop_str.strip():
@@ -41,84 +363,524 @@ class OpenAIClient:
         sequences = [seq.strip() for seq in stop_str.split(',') if seq.strip()]
         return sequences if sequences else None
     
+    def _stop_matcher(self) -> Optional[StopMatcher]:
+        """Client-side matcher for the stop sequences and stop patterns, or None if there are none.
+        
+        Servers may ignore stop sequences or cap how many they take, and
+        have no way to express patterns like "the first code block".
+        """
+        sequences = self._parse_stop_sequences(self.config.get('OpenAI', 'stop', '')) or []
+        automaton = compile_stops(tuple(sequences), tuple(self.config.get_stop_patterns()))
+        return StopMatcher(automaton) if automaton is not None else None
+    
+    def build_messages(self, context: str = '') -> List[Dict[str, str]]:
+        """Build the messages payload with the persistent system prompt first.
+        
+        Earlier messages are never rewritten, so every request starts with
+        the exact bytes of the previous one and provider prefix caches hit.
+        Retrieved context, if any, changes from turn to turn, so it goes
+        right before the newest question, after the cached prefix.
+        """
+        messages = []
+        system_prompt = self.config.get_system_prompt()
+        if system_prompt.strip():
+            messages.append({"role": "system", "content": system_prompt})
+        messages.extend(self.conversation_history)
+        if context:
+            at = len(messages) - 1 if messages and messages[-1]["role"] == Role.USER.value else len(messages)
+            messages.insert(at, {"role": "system", "content": context})
+        return messages
+    
+    def _remember(self, question: str, answer: str):
+        """Queue a finished exchange for the retrieval index and index it in the background"""
+        if self.chat_index is not None and self.config.is_retrieval_enabled():
+            with self.pending_lock:
+                self.pending_exchanges.append(exchange_text(question, answer))
+            self.index_pending_async()
+    
+    def _take_pending(self) -> List[str]:
+        """Remove and return the queued exchanges"""
+        with self.pending_lock:
+            pending, self.pending_exchanges = self.pending_exchanges, []
+        return pending
+    
+    def _requeue(self, pending: List[str], error: Exception):
+        """Put exchanges back after a failed embedding if the failure may pass.
+        
+        A backend without embeddings or an unknown embedding model fails
+        the same way every time, so those exchanges are dropped; the queue
+        is capped either way.
+        """
+        if not isinstance(error, RETRYABLE_ERRORS):
+            return
+        with self.pending_lock:
+            self.pending_exchanges = (pending + self.pending_exchanges)[-MAX_PENDING_EXCHANGES:]
+    
+    def index_pending_async(self) -> Optional[threading.Thread]:
+        """Embed queued exchanges in a background job; returns its thread, or None if nothing is queued"""
+        if self.chat_index is None or self.backend is None or not self.config.is_retrieval_enabled():
+            return None
+        pending = self._take_pending()
+        if not pending:
+            return None
+        backend = self.backend
+        model = self.config.get_embedding_model()
+        
+        def index():
+            try:
+                # Never cancelled, so it waits for interactive requests to finish
+                with self.scheduler.background(threading.Event()):
+                    vectors = backend.embed(pending, model)
+            except Exception as e:
+                self._requeue(pending, e)
+                return
+            try:
+                self.chat_index.add(pending, vectors, model)
+            except (IOError, OSError, ValueError) as e:
+                print(f"Warning: Chat index unavailable: {e}")
+        
+        self.index_thread = threading.Thread(target=index, daemon=True)
+        self.index_thread.start()
+        return self.index_thread
+    
+    def flush_index(self, timeout: float = INDEX_FLUSH_TIMEOUT_S):
+        """Index whatever is still queued and wait for it, e.g. before exiting"""
+        self.index_pending_async()
+        thread = self.index_thread
+        if thread is not None:
+            thread.join(timeout)
+    
+    def _retrieve_context(self, question: str) -> str:
+        """Find past exchanges relevant to a question.
+        
+        Exchanges left queued by a transient embedding failure are retried
+        in the same batch as the question, so each send makes one
+        embeddings request. Exchanges already on the current branch are
+        not returned. Returns the context message content, or '' if
+        nothing relevant was found.
+        """
+        if self.chat_index is None or self.backend is None or not self.config.is_retrieval_enabled():
+            return ''
+        model = self.config.get_embedding_model()
+        pending = self._take_pending()
+        try:
+            with self.scheduler.interactive():
+                vectors = self.backend.embed(pending + [question], model)
+        except Exception as e:
+            # Retrieval is best effort
+            self._requeue(pending, e)
+            return ''
+        try:
+            self.chat_index.add(pending, vectors[:-1], model)
+            # Exchanges folded into the summary may be retrieved again in full
+            nodes = self.conversation.nodes()
+            start, _ = self.conversation.summary_point(nodes)
+            exclude = frozenset(text_digest(text) for text in exchanges(nodes[start:]))
+            matches = self.chat_index.search(
+                vectors[-1], model, self.config.get_retrieval_top_k(), self.config.get_retrieval_min_score(), exclude
+            )
+        except (IOError, OSError, ValueError) as e:
+            print(f"Warning: Chat index unavailable: {e}")
+            return ''
+        return format_context([text for _, text in matches]) if matches else ''
+    
+    def _resolve_prefix_cache_mode(self, base_url: str) -> str:
+        """Resolve 'auto' prefix cache mode from the base URL"""
+        mode = self.config.get_prefix_cache_mode()
+        if mode != 'auto':
+            return mode
+        host = (urlparse(base_url).hostname or '').lower()
+        if host.endswith('openai.com'):
+            return 'openai'
+        if is_local_endpoint(base_url):
+            return 'llamacpp'
+        return 'off'
+    
+    def _prefix_cache_params(self, model: str, base_url: str) -> Dict[str, Any]:
+        """Extra body parameters that enable provider-side prompt caching"""
+        mode = self._resolve_prefix_cache_mode(base_url)
+        if mode == 'openai':
+            # Route requests sharing a system prompt and model to the same cache
+            seed = f"{model}\n{self.config.get_system_prompt()}"
+            return {"prompt_cache_key": "ghostpad-" + hashlib.sha1(seed.encode('utf-8')).hexdigest()[:16]}
+        if mode == 'llamacpp':
+            # llama.cpp server reuses the KV cache of the matching prefix
+            return {"cache_prompt": True}
+        return {}
+    
+    def _record_usage(self, usage):
+        """Record token usage, including prompt tokens served from cache"""
+        if usage is None:
+            return
+        cached_tokens = 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        if details is not None and getattr(details, 'cached_tokens', None):
+            cached_tokens = details.cached_tokens
+        elif getattr(usage, 'prompt_cache_hit_tokens', None):
+            # DeepSeek-style usage field
+            cached_tokens = usage.prompt_cache_hit_tokens
+        
+        self.last_usage = {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            'cached_tokens': cached_tokens or 0,
+        }
+        for key, value in self.last_usage.items():
+            self.session_usage[key] += value
+    
+    def add_note(self, role: Role, text: str) -> MessageNode:
+        """Record an error or notice in the history without sending it to the API"""
+        return self.conversation.append(role, text)
+    
     def clear_conversation(self):
         """Clear conversation history for new chat"""
-        self.conversation_history = []
+        self.conversation.clear()
+        self.terminate_current_request()
+    
+    def fork_conversation(self) -> str:
+        """Fork the current branch so an alternative reply can be explored"""
+        return self.conversation.fork()
+    
+    def switch_branch(self, name: str):
+        """Switch to another conversation branch"""
         self.terminate_current_request()
+        self.conversation.switch(name)
+    
+    def edit_question(self, node: Optional[MessageNode] = None) -> Optional[MessageNode]:
+        """Fork a new branch just before a user message (default: the last one) and return it.
+        
+        The next message sent is appended in its place, while the original
+        question and everything after it stay available on the previous branch.
+        """
+        if node is None:
+            node = self.conversation.last_node(Role.USER)
+        if node is None:
+            return None
+        self.terminate_current_request()
+        self.conversation.fork(at=node.parent)
+        return node
     
     def terminate_current_request(self):
         """Terminate current API request"""
-        self.terminate_request = True
-        # Fixed: can't actually kill the thread, but we set the flag
-        # The thread will check this flag and exit gracefully
+        # Threads can't be killed; the request's thread checks its event and exits
+        self.request_cancel.set()
+        self.cancel_compaction()
     
-    def send_message_async(self, message: str, callback: Callable[[str], None], error_callback: Callable[[str], None]):
-        """Send message to OpenAI API asynchronously"""
-        # Terminate any existing request
+    def _begin_request(self) -> threading.Event:
+        """Terminate the current request and return the cancel event of a new one.
+        
+        Each request keeps its own event, so one that is still waiting for
+        its first chunk stays terminated when the next request starts.
+        Call with request_lock held.
+        """
         self.terminate_current_request()
-        self.terminate_request = False
+        self.request_cancel = threading.Event()
+        return self.request_cancel
+    
+    def cancel_compaction(self):
+        """Stop a running compaction; the conversation is left as it was"""
+        if self.compaction_cancel is not None:
+            self.compaction_cancel.set()
+            self.compaction_cancel = None
+    
+    def compact_async(self) -> bool:
+        """Fold old turns of the current branch into its rolling summary in the background.
+        
+        Meant for idle time. The newest messages stay verbatim and the cut
+        is made after an answer, so a question is never separated from its
+        answer. The summary request uses the compaction model, is dropped
+        by any new request and never holds one up. Returns whether a
+        compaction was started.
+        """
+        if self.backend is None or self.compaction_cancel is not None or not self.config.is_compaction_enabled():
+            return False
+        nodes = self.conversation.nodes()
+        start, summary = self.conversation.summary_point(nodes)
+        pending = [node for node in nodes[start:] if node.in_payload]
+        if sum(len(node.content) for node in pending) < self.config.get_compaction_trigger_chars():
+            return False
+        cut = len(pending) - self.config.get_compaction_keep_messages()
+        while cut > 0 and pending[cut - 1].role != Role.ASSISTANT:
+            cut -= 1
+        if cut <= 0:
+            return False
+        
+        folded = pending[:cut]
+        prompt = COMPACT_PROMPT.format(
+            summary=summary or "(none yet)",
+            turns="\n\n".join(f"{node.role.label}: {node.content}" for node in folded)
+        )
+        backend = self.backend
+        params = self._request_params(self.config.get_compaction_model() or None)
+        params['max_tokens'] = min(params['max_tokens'], COMPACT_MAX_TOKENS)
+        params['stop'] = None
+        cancel = threading.Event()
+        self.compaction_cancel = cancel
+        
+        def compact():
+            parts: List[str] = []
+            try:
+                # Waits for interactive requests; one starting later sets cancel
+                with self.scheduler.background(cancel) as admitted:
+                    if not admitted:
+                        return
+                    # Streamed so a cancel takes effect between chunks
+                    stream = backend.create([{"role": "user", "content": prompt}], stream=True, **params)
+                    try:
+                        for chunk in stream:
+                            if cancel.is_set():
+                                return
+                            if getattr(chunk, 'usage', None):
+                                self._record_usage(chunk.usage)
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                parts.append(chunk.choices[0].delta.content)
+                    finally:
+                        stream.close()
+            except Exception:
+                # Compaction is best effort; the full history is sent meanwhile
+                return
+            finally:
+                if self.compaction_cancel is cancel:
+                    self.compaction_cancel = None
+            
+            text = ''.join(parts).strip()
+            if text and not cancel.is_set():
+                self.conversation.summaries[folded[-1]] = text
+        
+        threading.Thread(target=compact, daemon=True).start()
+        return True
+    
+    def send_message_async(self, message: str, callback: Callable[[str], None], error_callback: Callable[[str], None],
+                           progress_callback: Callable[[str, str], None] = _ignore_progress,
+                           delta_callback: Callable[[str], None] = _ignore_delta):
+        """Send message to OpenAI API asynchronously, streaming the reply.
+        
+        progress_callback receives (state, detail) updates and delta_callback
+        each piece of reply text; both are called from the request thread.
+        """
+        with self.request_lock:
+            # Terminate any existing request
+            cancel = self._begin_request()
+            # Record the question right away so the history shows it in order,
+            # even if the request fails or is terminated below
+            user_node = self.conversation.append(Role.USER, message) if message.strip() else None
         
         def api_call():
             try:
-                if not openai.api_key:
+                if self.backend is None:
+                    if user_node is not None:
+                        user_node.in_payload = False
                     error_callback("API key not configured. Right-click to set your OpenAI API key.")
                     return
                 
-                # Check if request was terminated before starting
-                if self.terminate_request:
-                    error_callback("User terminated response")
-                    return
-                
-                if not message.strip():
+                if user_node is None:
                     error_callback("Please enter a message.")
                     return
                 
-                # Add user message to conversation history
-                self.conversation_history.append({"role": "user", "content": message})
-                
                 # Check if request was terminated before API call
-                if self.terminate_request:
-                    # Remove the user message we just added since request was terminated
-                    self.conversation_history.pop()
-                    error_callback("User terminated response")
+                if cancel.is_set():
+                    # Keep the question in history but leave it out of later requests
+                    user_node.in_payload = False
                     return
                 
-                response = openai.chat.completions.create(
-                    model=self.config.get_model(),
-                    messages=self.conversation_history,
-                    max_tokens=int(self.config.get('OpenAI', 'max_tokens', '4096')),
-                    temperature=float(self.config.get('OpenAI', 'temperature', '1.0')),
-                    top_p=float(self.config.get('OpenAI', 'top_p', '1.0')),
-                    presence_penalty=float(self.config.get('OpenAI', 'presence_penalty', '0.0')),
-                    frequency_penalty=float(self.config.get('OpenAI', 'frequency_penalty', '0.0')),
-                    stop=self._parse_stop_sequences(self.config.get('OpenAI', 'stop', ''))
-                )
+                context = self._retrieve_context(message)
+                ai_response = self._stream(self.build_messages(context), progress_callback, delta_callback, cancel)
                 
-                # Check if request was terminated after API call
-                if self.terminate_request:
-                    # Remove the user message since request was terminated
-                    self.conversation_history.pop()
-                    return
-                
-                if response.choices:
-                    ai_response = response.choices[0].message.content.strip()
+                with self.request_lock:
+                    # Check if request was terminated after API call
+                    if ai_response is None or cancel.is_set():
+                        # Leave the terminated question out of later requests
+                        user_node.in_payload = False
+                        return
+                    
                     # Add AI response to conversation history
-                    self.conversation_history.append({"role": "assistant", "content": ai_response})
-                    callback(ai_response)
-                else:
-                    error_callback("No response received from API.")
+                    self.conversation.append(Role.ASSISTANT, ai_response)
+                self._remember(message, ai_response)
+                callback(ai_response)
                     
-            except openai.AuthenticationError:
-                error_callback("Invalid API key. Please check your OpenAI API key.")
-            except openai.RateLimitError:
-                error_callback("Rate limit exceeded. Please try again later.")
             except Exception as e:
-                if "timeout" in str(e).lower():
-                  error_callback("API timeout. Please try again.")
-                else:
-                  error_callback(f"Error: {str(e)}")
+                if not cancel.is_set():
+                    error_callback(self._describe_error(e))
         
         # Run API call in separate thread
         self.current_request_thread = threading.Thread(target=api_call)
         self.current_request_thread.daemon = True
-        self.current_request_thread.start()
\ No newline at end of file
+        self.current_request_thread.start()
+    
+    def summarize_large_input_async(self, text: str, instruction: str, description: str,
+                                    callback: Callable[[str], None], error_callback: Callable[[str], None],
+                                    progress_callback: Callable[[str, str], None] = _ignore_progress,
+                                    delta_callback: Callable[[str], None] = _ignore_delta):
+        """Answer an instruction about a text too large for one request.
+        
+        The text is split into chunks that are condensed concurrently (map),
+        then the notes are combined in a final request that carries the
+        conversation context (reduce). Only the instruction and the notes
+        are kept in the conversation, not the original text.
+        """
+        with self.request_lock:
+            cancel = self._begin_request()
+            user_node = self.conversation.append(Role.USER, f"{instruction}\n\n[Pasted text: {description}]")
+        progress_lock = threading.Lock()
+        done = 0
+        
+        def map_chunk(job):
+            index, total, chunk = job
+            if cancel.is_set():
+                return ""
+            prompt = MAP_PROMPT.format(index=index, total=total, instruction=instruction, chunk=chunk)
+            note = self._complete([{"role": "user", "content": prompt}], cancel, progress_callback)
+            nonlocal done
+            with progress_lock:
+                done += 1
+                progress_callback(STATE_WAITING, f"{done}/{total} parts")
+            return note
+        
+        def api_call():
+            nonlocal done
+            try:
+                if self.backend is None:
+                    user_node.in_payload = False
+                    error_callback("API key not configured. Right-click to set your OpenAI API key.")
+                    return
+                
+                # Map chunks to notes, then keep reducing until the notes fit in one chunk
+                notes = text
+                with ThreadPoolExecutor(max_workers=MAP_REDUCE_WORKERS) as pool:
+                    while len(notes) > MAP_REDUCE_CHUNK_CHARS:
+                        chunks = split_text(notes, MAP_REDUCE_CHUNK_CHARS)
+                        done = 0
+                        jobs = [(i + 1, len(chunks), chunk) for i, chunk in enumerate(chunks)]
+                        reduced = "\n\n".join(
+                            f"[Part {i}]\n{note}" for (i, _, _), note in zip(jobs, pool.map(map_chunk, jobs))
+                        )
+                        if cancel.is_set():
+                            user_node.in_payload = False
+                            return
+                        if len(reduced) >= len(notes):
+                            # Notes stopped shrinking; send what we have
+                            notes = reduced
+                            break
+                        notes = reduced
+                
+                user_node.content = REDUCE_PROMPT.format(instruction=instruction, description=description, notes=notes)
+                ai_response = self._stream(self.build_messages(), progress_callback, delta_callback, cancel)
+                
+                with self.request_lock:
+                    if ai_response is None or cancel.is_set():
+                        user_node.in_payload = False
+                        return
+                    
+                    self.conversation.append(Role.ASSISTANT, ai_response)
+                self._remember(f"{instruction}\n\n[Pasted text: {description}]", ai_response)
+                callback(ai_response)
+                
+            except Exception as e:
+                user_node.in_payload = False
+                if not cancel.is_set():
+                    error_callback(self._describe_error(e))
+        
+        self.current_request_thread = threading.Thread(target=api_call)
+        self.current_request_thread.daemon = True
+        self.current_request_thread.start()
+    
+    def proxy_request(self, body: Dict[str, Any]) -> Any:
+        """Run a chat completion for another local tool, as backend.create would.
+        
+        Goes to the active profile's backend through the same deduplication
+        as the app's own requests; the model defaults to the configured one.
+        Other fields (tools, response_format, n, ...) are sent on unchanged
+        to a remote endpoint; any other backend rejects them by name rather
+        than silently answering a different request.
+        """
+        backend = self.backend
+        if backend is None:
+            raise BackendUnavailableError("API key not configured in GhostPad.")
+        params = {key: body[key] for key in PROXY_PARAMS if body.get(key) is not None}
+        params.setdefault('model', self.config.get_model())
+        extra = {key: value for key, value in body.items()
+                 if key not in PROXY_PARAMS and key not in PROXY_HANDLED and value is not None}
+        if extra:
+            if backend.name != BACKEND_REMOTE:
+                raise UnsupportedParamsError(
+                    f"Not supported by the {backend.name} backend: {', '.join(sorted(extra))}."
+                )
+            params['extra_body'] = extra
+        return self.flights.create(backend, body['messages'], stream=bool(body.get('stream')), **params)
+    
+    def get_compare_targets(self) -> List[ModelTarget]:
+        """Models configured for compare mode, each with a backend for its endpoint"""
+        main_url = self.config.get_base_url()
+        targets = []
+        for entry in self.config.get_compare_models().split(','):
+            model, _, base_url = entry.partition('@')
+            model = model.strip()
+            base_url = base_url.strip() or main_url
+            if not model:
+                continue
+            
+            if base_url == main_url:
+                # Compare mode always talks to endpoints, even with the local backend selected
+                backend = self.backend if isinstance(self.backend, RemoteBackend) else self._remote_backend(base_url)
+                label = model
+            else:
+                backend = self._remote_backend(base_url)
+                label = f"{model} @ {urlparse(base_url).netloc or base_url}"
+            targets.append(ModelTarget(label, model, base_url, backend))
+        return targets[:MAX_COMPARE_MODELS]
+    
+    def compare_async(self, message: str, targets: List[ModelTarget],
+                      delta_callback: Callable[[int, str], None],
+                      done_callback: Callable[[int, str, Dict[str, float]], None],
+                      error_callback: Callable[[int, str], None]) -> threading.Event:
+        """Send the same conversation plus message to several models concurrently.
+        
+        Nothing is added to the conversation until a reply is accepted with
+        accept_comparison. Callbacks receive the target index and are called
+        from the request threads; none is called once the returned cancel
+        event is set, e.g. by the next request.
+        """
+        with self.request_lock:
+            cancel = self._begin_request()
+        
+        # Built once and shared read-only by every request
+        messages = self.build_messages() + [{"role": "user", "content": message}]
+        
+        def run(index: int, target: ModelTarget):
+            start = time.monotonic()
+            first_token_at = None
+            tokens = 0
+            
+            def on_delta(text: str):
+                nonlocal first_token_at, tokens
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                tokens += 1
+                delta_callback(index, text)
+            
+            try:
+                reply = self._stream(messages, _ignore_progress, on_delta, cancel, target)
+                if reply is None or cancel.is_set():
+                    return
+                end = time.monotonic()
+                streaming_s = end - first_token_at
+                done_callback(index, reply, {
+                    'first_token_s': first_token_at - start,
+                    'total_s': end - start,
+                    'tokens': tokens,
+                    'tokens_per_s': tokens / streaming_s if streaming_s > 0 else 0.0,
+                })
+            except Exception as e:
+                if not cancel.is_set():
+                    error_callback(index, self._describe_error(e))
+        
+        for index, target in enumerate(targets):
+            threading.Thread(target=run, args=(index, target), daemon=True).start()
+        return cancel
+    
+    def accept_comparison(self, message: str, reply: str, target: ModelTarget):
+        """Merge a chosen comparison reply into the conversation"""
+        self.conversation.append(Role.USER, message)
+        self.conversation.append(Role.ASSISTANT, reply)
+        self._remember(message, reply)
+        self.add_note(Role.NOTICE, f"Answer chosen from {target.label}")
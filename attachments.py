@@ -0,0 +1,127 @@
+import codecs
+import hashlib
+import mmap
+import os
+from typing import Callable, Dict, List, Optional
+
+from chunking import CHARS_PER_TOKEN, describe_counts, estimate_tokens, split_text
+
+ATTACHMENT_TOKEN_BUDGET = 8000  # Tokens of attached text allowed per message
+ATTACHMENT_CHUNK_CHARS = 4000  # Granularity used when trimming to the budget
+READ_BLOCK_BYTES = 1 << 20  # Bytes decoded per step when reading a file
+
+class Attachment:
+    """Text attached to the next message, identified by a hash of its content.
+
+    Only the part that can ever be sent is kept: text is a prefix of the
+    content when chars (the full length) is larger.
+    """
+    __slots__ = ('name', 'text', 'digest', 'chars', 'description')
+
+    def __init__(self, name: str, text: str, digest: str, chars: Optional[int] = None, lines: Optional[int] = None):
+        self.name = name
+        self.text = text
+        self.digest = digest
+        self.chars = len(text) if chars is None else chars
+        self.description = describe_counts(self.chars, text.count('\n') + 1 if lines is None else lines)
+
+    @property
+    def header(self) -> str:
+        """Header line that starts this attachment in a message"""
+        return f"--- Attachment: {self.name} (sha256 {self.digest[:12]}) ---"
+
+    @property
+    def marker(self) -> str:
+        """Placeholder shown in the text box while the attachment is pending"""
+        return f"[Attached: {self.name}, {self.description}]"
+
+def read_file(path: str, max_chars: int = ATTACHMENT_TOKEN_BUDGET * CHARS_PER_TOKEN) -> Attachment:
+    """Read a text file through mmap, hashing and measuring it block by block.
+
+    Meant to run off the UI thread. The whole file is hashed and its
+    characters and lines counted, but only the first max_chars characters
+    (as much as the token budget can ever send) are kept, so a multi-GB log
+    costs no more memory than a small one. Undecodable bytes are replaced
+    rather than rejected, so logs with stray binary data still attach.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    sha = hashlib.sha256()
+    parts = []
+    kept = chars = lines = 0
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in range(0, len(mapped), READ_BLOCK_BYTES):
+                    block = mapped[offset:offset + READ_BLOCK_BYTES]
+                    sha.update(block)
+                    lines += block.count(b'\n')
+                    text = decoder.decode(block)
+                    chars += len(text)
+                    if kept < max_chars:
+                        parts.append(text[:max_chars - kept])
+                        kept += len(parts[-1])
+    text = decoder.decode(b'', final=True)
+    chars += len(text)
+    if kept < max_chars:
+        parts.append(text[:max_chars - kept])
+    return Attachment(os.path.basename(path), ''.join(parts), sha.hexdigest(), chars, lines + 1)
+
+def from_text(name: str, text: str) -> Attachment:
+    """Wrap text (e.g. from the clipboard) as an attachment"""
+    return Attachment(name, text, hashlib.sha256(text.encode('utf-8')).hexdigest())
+
+class AttachmentSet:
+    """Attachments pending for the next message, deduplicated by content hash"""
+
+    def __init__(self):
+        self.items: Dict[str, Attachment] = {}
+
+    def add(self, attachment: Attachment) -> bool:
+        """Add an attachment; returns False if the same content is already pending"""
+        if attachment.digest in self.items:
+            return False
+        self.items[attachment.digest] = attachment
+        return True
+
+    def clear(self):
+        """Drop all pending attachments"""
+        self.items.clear()
+
+    def present_in(self, text: str) -> List[Attachment]:
+        """Pending attachments whose marker is still in the text box"""
+        return [a for a in self.items.values() if a.marker in text]
+
+    def strip_markers(self, text: str) -> str:
+        """Remove attachment markers from the typed text"""
+        for attachment in self.items.values():
+            text = text.replace(attachment.marker, '')
+        return text.strip()
+
+def build_message(text: str, attachments: List[Attachment], already_sent: Callable[[str], bool],
+                  token_budget: int = ATTACHMENT_TOKEN_BUDGET) -> str:
+    """Append attachments to a message, chunked to stay under the token budget.
+
+    Attachments whose header is already in the conversation are referenced
+    instead of being sent again.
+    """
+    parts = [text] if text else []
+    remaining = token_budget
+    for attachment in attachments:
+        if already_sent(attachment.header):
+            parts.append(f"{attachment.header}\n[Same content as attached earlier in this conversation]")
+            continue
+
+        included: List[str] = []
+        chunks = split_text(attachment.text, ATTACHMENT_CHUNK_CHARS)
+        for chunk in chunks:
+            cost = estimate_tokens(chunk)
+            if cost > remaining:
+                break
+            included.append(chunk)
+            remaining -= cost
+
+        body = ''.join(included)
+        if len(body) < attachment.chars:
+            body += f"\n[Truncated: {len(body):,} of {attachment.chars:,} chars included to fit the token budget]"
+        parts.append(f"{attachment.header}\n{body}")
+    return "\n\n".join(parts)
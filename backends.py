@@ -0,0 +1,179 @@
+import os
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import openai
+
+try:
+    # Optional: runs GGUF models in-process through llama.cpp
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+BACKEND_REMOTE = 'remote'
+BACKEND_LOCAL = 'local'
+BACKENDS = (BACKEND_REMOTE, BACKEND_LOCAL)
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+PREWARM_PROMPT = "Hi"
+
+# Request parameters the in-process runtime understands; the rest
+# (model name, extra_body, stream_options) only mean something to a server
+LOCAL_PARAMS = ('max_tokens', 'temperature', 'top_p', 'presence_penalty', 'frequency_penalty', 'stop')
+
+def is_local_endpoint(base_url: str) -> bool:
+    """Check whether a base URL points at a server on this machine"""
+    return (urlparse(base_url).hostname or '').lower() in LOCAL_HOSTS
+
+class BackendUnavailableError(Exception):
+    """Raised when the selected backend cannot run (missing package or model file)"""
+
+class Backend:
+    """Source of chat completions.
+
+    create() mirrors the OpenAI chat completions call. With stream=True it
+    returns an iterable of chunks that has a close() method; otherwise a
+    single response. Both have the OpenAI attribute shape
+    (choices[0].delta.content, choices[0].message.content, usage), so the
+    client's streaming, retry and cancellation code is shared by every
+    backend.
+    """
+    name = ''
+    last_warm = float('-inf')  # monotonic time of the last pre-warm; a new backend starts cold
+
+    def create(self, messages: List[Dict[str, str]], stream: bool = False, **params) -> Any:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """Embedding vectors for texts, in order"""
+        raise BackendUnavailableError("This backend does not provide embeddings.")
+
+    def warm(self, messages: List[Dict[str, str]], params: Dict[str, Any]):
+        """Get ready for the next request; called off the UI thread"""
+
+    def _warm_prefix(self, messages: List[Dict[str, str]], params: Dict[str, Any]):
+        """One-token completion that loads the model and caches the prompt prefix"""
+        messages = messages + [{"role": "user", "content": PREWARM_PROMPT}]
+        self.create(messages, **dict(params, max_tokens=1, stop=None))
+
+class RemoteBackend(Backend):
+    """OpenAI-compatible HTTP endpoint"""
+    name = BACKEND_REMOTE
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None):
+        self.base_url = base_url
+        # Retries are done by the caller so they can be reported as a progress state
+        self.client = openai.OpenAI(api_key=api_key or 'not-needed', base_url=base_url, max_retries=0)
+
+    def create(self, messages: List[Dict[str, str]], stream: bool = False, **params) -> Any:
+        if stream:
+            return self.client.chat.completions.create(
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params
+            )
+        return self.client.chat.completions.create(messages=messages, **params)
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        response = self.client.embeddings.create(model=model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def warm(self, messages: List[Dict[str, str]], params: Dict[str, Any]):
+        """A model listing leaves a pooled connection with DNS, TCP and TLS done;
+        a server on this machine also gets the prompt prefix evaluated"""
+        if is_local_endpoint(self.base_url):
+            self._warm_prefix(messages, params)
+        else:
+            self.client.models.list()
+
+class _LocalStream:
+    """Chunks from the local model; holds the model until closed"""
+
+    def __init__(self, chunks, lock: threading.Lock):
+        self._chunks = chunks
+        self._lock = lock
+
+    def __iter__(self):
+        for data in self._chunks:
+            yield SimpleNamespace(
+                choices=[
+                    SimpleNamespace(delta=SimpleNamespace(content=choice.get('delta', {}).get('content')))
+                    for choice in data.get('choices', ())
+                ],
+                usage=None
+            )
+
+    def close(self):
+        if self._chunks is None:
+            return
+        # Closing the generator stops token generation where it is
+        self._chunks.close()
+        self._chunks = None
+        self._lock.release()
+
+class LocalBackend(Backend):
+    """GGUF model run in-process with llama.cpp (the llama-cpp-python package).
+
+    The model is loaded on first use, off the UI thread. One model
+    instance cannot run two generations at once, so requests (e.g. the
+    parts of a large paste) take turns.
+    """
+    name = BACKEND_LOCAL
+
+    def __init__(self, model_path: str, context_size: int = 4096, gpu_layers: int = 0):
+        self.model_path = model_path
+        self.context_size = context_size
+        self.gpu_layers = gpu_layers
+        self._llama = None
+        self._load_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    def _model(self):
+        with self._load_lock:
+            if self._llama is None:
+                if Llama is None:
+                    raise BackendUnavailableError(
+                        "The local backend needs llama-cpp-python. Install it with: pip install llama-cpp-python"
+                    )
+                if not os.path.isfile(self.model_path):
+                    raise BackendUnavailableError(
+                        f"Local model file not found: {self.model_path or '(not set)'}. Set it in LLM Settings."
+                    )
+                self._llama = Llama(
+                    model_path=self.model_path,
+                    n_ctx=self.context_size,
+                    n_gpu_layers=self.gpu_layers,
+                    verbose=False
+                )
+            return self._llama
+
+    def create(self, messages: List[Dict[str, str]], stream: bool = False, **params) -> Any:
+        llama = self._model()
+        kwargs = {key: params[key] for key in LOCAL_PARAMS if params.get(key) is not None}
+        self._run_lock.acquire()
+        if stream:
+            try:
+                chunks = llama.create_chat_completion(messages=messages, stream=True, **kwargs)
+            except BaseException:
+                self._run_lock.release()
+                raise
+            return _LocalStream(chunks, self._run_lock)
+        try:
+            data = llama.create_chat_completion(messages=messages, **kwargs)
+        finally:
+            self._run_lock.release()
+        usage = data.get('usage')
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content=choice.get('message', {}).get('content')))
+                for choice in data.get('choices', ())
+            ],
+            usage=SimpleNamespace(**usage) if usage else None
+        )
+
+    def warm(self, messages: List[Dict[str, str]], params: Dict[str, Any]):
+        """Load the model and evaluate the prompt prefix, which llama.cpp keeps for the next request"""
+        self._warm_prefix(messages, params)
@@ -0,0 +1,167 @@
+import json
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from backends import Backend, BackendUnavailableError
+from singleflight import payload_digest
+
+CASSETTE_OFF = 'off'
+CASSETTE_RECORD = 'record'
+CASSETTE_REPLAY = 'replay'
+CASSETTE_MODES = (CASSETTE_OFF, CASSETTE_RECORD, CASSETTE_REPLAY)
+CASSETTE_DIR = 'cassettes'
+
+def _usage_dict(usage) -> Optional[Dict[str, int]]:
+    """Token usage fields the client reads, or None"""
+    if usage is None:
+        return None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        'cached_tokens': getattr(details, 'cached_tokens', 0) or 0,
+    }
+
+def _usage(data: Optional[Dict[str, int]]):
+    """Usage object rebuilt from a cassette"""
+    if data is None:
+        return None
+    return SimpleNamespace(
+        prompt_tokens=data['prompt_tokens'],
+        completion_tokens=data['completion_tokens'],
+        prompt_tokens_details=SimpleNamespace(cached_tokens=data['cached_tokens'])
+    )
+
+def _chunk(content: Optional[str], usage: Optional[Dict[str, int]]):
+    """Stream chunk rebuilt from a cassette; a usage-only chunk has no choices"""
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=_usage(usage))
+
+class _RecordingStream:
+    """Passes chunks through while noting each one's time since the request started"""
+
+    def __init__(self, stream, cassette: Dict[str, Any], started: float, save):
+        self._stream = stream
+        self._cassette = cassette
+        self._started = started
+        self._save = save
+
+    def __iter__(self):
+        chunks = self._cassette['chunks']
+        for chunk in self._stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            chunks.append([time.monotonic() - self._started, content, _usage_dict(getattr(chunk, 'usage', None))])
+            yield chunk
+        self._cassette['complete'] = True
+
+    def close(self):
+        if self._save is None:
+            return
+        self._stream.close()
+        self._save(self._cassette)
+        self._save = None
+
+class RecordingBackend(Backend):
+    """Records every completion of another backend to a cassette file.
+
+    One JSON file per distinct request, named by the hash of its payload, so
+    replaying the same session finds each reply again. Streams keep each
+    chunk's text, usage and time since the request was sent; a stream the
+    user cancelled is saved as far as it got.
+    """
+
+    def __init__(self, inner: Backend, path: Path):
+        self.inner = inner
+        self.name = inner.name
+        self.path = Path(path)
+
+    def _save(self, cassette: Dict[str, Any]):
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            target = self.path / f"{cassette['key']}.json"
+            temp = target.with_suffix('.tmp')
+            temp.write_text(json.dumps(cassette), encoding='utf-8')
+            os.replace(temp, target)
+        except (IOError, OSError) as e:
+            print(f"Warning: Failed to save cassette: {e}")
+
+    def create(self, messages: List[Dict[str, str]], stream: bool = False, **params) -> Any:
+        cassette = {
+            'key': payload_digest(messages, stream, params),
+            'recorded_at': time.time(),
+            'request': {'messages': messages, 'params': params, 'stream': stream},
+            'complete': False,
+        }
+        started = time.monotonic()
+        response = self.inner.create(messages, stream=stream, **params)
+        if stream:
+            cassette['chunks'] = []
+            return _RecordingStream(response, cassette, started, self._save)
+        cassette['elapsed_s'] = time.monotonic() - started
+        cassette['content'] = response.choices[0].message.content if response.choices else None
+        cassette['usage'] = _usage_dict(getattr(response, 'usage', None))
+        cassette['complete'] = True
+        self._save(cassette)
+        return response
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        return self.inner.embed(texts, model)
+
+    def warm(self, messages: List[Dict[str, str]], params: Dict[str, Any]):
+        self.inner.warm(messages, params)
+
+class _ReplayStream:
+    """Recorded chunks, released at their recorded times multiplied by the time scale"""
+
+    def __init__(self, chunks: List[list], time_scale: float):
+        self._chunks = chunks
+        self._time_scale = time_scale
+        self._closed = False
+
+    def __iter__(self):
+        started = time.monotonic()
+        for offset, content, usage in self._chunks:
+            if self._closed:
+                return
+            delay = started + offset * self._time_scale - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield _chunk(content, usage)
+
+    def close(self):
+        self._closed = True
+
+class ReplayBackend(Backend):
+    """Serves completions from cassettes recorded by RecordingBackend, with no network.
+
+    A time scale of 1.0 reproduces the recorded timing, 0.5 runs twice as
+    fast and 0 delivers everything at once. A request with no recording
+    fails like an unavailable backend.
+    """
+    name = CASSETTE_REPLAY
+
+    def __init__(self, path: Path, time_scale: float = 1.0):
+        self.path = Path(path)
+        self.time_scale = time_scale
+
+    def _load(self, key: str) -> Dict[str, Any]:
+        try:
+            return json.loads((self.path / f"{key}.json").read_text(encoding='utf-8'))
+        except (IOError, OSError, ValueError):
+            raise BackendUnavailableError(f"No recording for this request in {self.path}.")
+
+    def create(self, messages: List[Dict[str, str]], stream: bool = False, **params) -> Any:
+        cassette = self._load(payload_digest(messages, stream, params))
+        if stream:
+            return _ReplayStream(cassette['chunks'], self.time_scale)
+        delay = cassette.get('elapsed_s', 0.0) * self.time_scale
+        if delay > 0:
+            time.sleep(delay)
+        content = cassette.get('content')
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))] if content is not None else [],
+            usage=_usage(cassette.get('usage'))
+        )
@@ -0,0 +1,38 @@
+from typing import List
+
+# Rough characters-per-token ratio for English text and code
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate that avoids loading a tokenizer"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars, preferring line boundaries"""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + max_chars, length)
+        if end < length:
+            # Cut after the last newline in the window, if there is one
+            newline = text.rfind('\n', start, end)
+            if newline > start:
+                end = newline + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+def describe_size(text: str) -> str:
+    """Human-readable size of a text, e.g. '1.2M chars, 40,310 lines'"""
+    return describe_counts(len(text), text.count('\n') + 1)
+
+def describe_counts(chars: int, lines: int) -> str:
+    """Human-readable size from character and line counts"""
+    if chars >= 1_000_000:
+        size = f"{chars / 1_000_000:.1f}M chars"
+    elif chars >= 1_000:
+        size = f"{chars / 1_000:.1f}K chars"
+    else:
+        size = f"{chars} chars"
+    return f"{size}, {lines:,} lines"
@@ -1,11 +1,20 @@
 import configparser
+from contextlib import contextmanager
 from pathlib import Path
 
+PROFILE_PREFIX = 'Profile:'  # Section name prefix of named profiles
+PROFILE_SECTIONS = ('OpenAI', 'Local')  # Sections whose keys a profile can override
+
 class Config:
     def __init__(self):
         self.config_dir = Path.home() / '.ghostpad'
         self.config_file = self.config_dir / 'config.ini'
         self.config = configparser.ConfigParser()
+        self.active_profile = ''  # '' means the base settings
+        self._profile = None  # Section of the active profile
+        self._batch_depth = 0
+        self._dirty = False  # In-memory changes not yet written
+        self._pending_profile = None  # Profile chosen by select_profile and not yet written
         self.ensure_config_exists()
         self.load_config()
     
@@ -26,7 +35,18 @@ class Config:
             'top_p': '1.0',
             'presence_penalty': '0.0',
             'frequency_penalty': '0.0',
-            'stop': ''
+            'stop': '',
+            'stop_after': '',
+            'system_prompt': '',
+            'prefix_cache': 'auto',
+            'prewarm': 'true',
+            'prewarm_interval': '120',
+            'backend': 'remote'
+        }
+        self.config['Local'] = {
+            'model_path': '',
+            'context_size': '4096',
+            'gpu_layers': '0'
         }
         self.config['Window'] = {
             'width': '400',
@@ -34,6 +54,30 @@ class Config:
             'x': '100',
             'y': '100'
         }
+        self.config['Compare'] = {
+            'models': ''
+        }
+        self.config['Retrieval'] = {
+            'enabled': 'false',
+            'embedding_model': 'text-embedding-3-small',
+            'top_k': '3',
+            'min_score': '0.4'
+        }
+        self.config['Compaction'] = {
+            'enabled': 'false',
+            'model': '',
+            'trigger_chars': '16000',
+            'keep_messages': '6'
+        }
+        self.config['Proxy'] = {
+            'enabled': 'false',
+            'port': '8765'
+        }
+        self.config['Cassette'] = {
+            'mode': 'off',
+            'path': '',
+            'time_scale': '1.0'
+        }
         self.config['Hotkey'] = {
             'toggle_keys': 'esc',
             'toggle_enabled': 'true',
@@ -54,26 +98,165 @@ class Config:
             # If config file is corrupted, create a new default one
             print(f"Warning: Failed to load config file: {e}. Creating default config.")
             self.create_default_config()
+        self._resolve_profile()
+    
+    def _resolve_profile(self):
+        """Look up the active profile once, so reads stay a dict lookup"""
+        name = self.config.get('Profiles', 'active', fallback='')
+        section = PROFILE_PREFIX + name
+        if name and section in self.config:
+            self.active_profile = name
+            self._profile = self.config[section]
+        else:
+            self.active_profile = ''
+            self._profile = None
+    
+    def reload(self):
+        """Re-read the config file and return the (section, key) pairs whose values changed"""
+        fresh = configparser.ConfigParser()
+        try:
+            fresh.read(self.config_file)
+        except (IOError, OSError, configparser.Error) as e:
+            print(f"Warning: Failed to reload config file: {e}")
+            return set()
+        if not fresh.sections():
+            # Empty or half-written file; keep the current settings
+            return set()
+        if self._batch_depth:
+            # Our own batch of changes is about to be written; it reloads after that
+            return set()
+        pending = self._pending_profile
+        if pending is not None:
+            # A profile switch not written yet is kept on top of the edited file
+            if not pending or PROFILE_PREFIX + pending in fresh:
+                if 'Profiles' not in fresh:
+                    fresh['Profiles'] = {}
+                fresh['Profiles']['active'] = pending
+            else:
+                pending = None
+        
+        old = self._values(self.config)
+        new = self._values(fresh)
+        self.config = fresh
+        self._pending_profile = pending
+        self._dirty = pending is not None
+        self._resolve_profile()
+        return {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+    
+    @staticmethod
+    def _values(parser):
+        """Raw values of a parser keyed by (section, key)"""
+        return {
+            (section, key): value
+            for section in parser.sections()
+            for key, value in parser.items(section, raw=True)
+        }
     
     def save_config(self):
         """Save configuration to file"""
         try:
             with open(self.config_file, 'w') as configfile:
                 self.config.write(configfile)
+            self._dirty = False
+            self._pending_profile = None
         except (IOError, OSError) as e:
             print(f"Error: Failed to save config file: {e}")
             raise
     
+    def flush(self):
+        """Write in-memory changes that were deferred"""
+        if self._dirty:
+            self.save_config()
+    
+    @contextmanager
+    def batch(self):
+        """Group several set() calls into one file write"""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+    
     def get(self, section, key, fallback=None):
-        """Get configuration value"""
+        """Get configuration value, from the active profile if it overrides it"""
+        if self._profile is not None and section in PROFILE_SECTIONS and key in self._profile:
+            return self._profile.get(key)
         return self.config.get(section, key, fallback=fallback)
     
     def set(self, section, key, value):
-        """Set configuration value"""
+        """Set configuration value; while a profile is active, LLM settings are saved to it"""
+        if self._profile is not None and section in PROFILE_SECTIONS:
+            self._profile[key] = str(value)
+        else:
+            if section not in self.config:
+                self.config[section] = {}
+            self.config[section][key] = str(value)
+        self._dirty = True
+        if self._batch_depth == 0:
+            self.save_config()
+    
+    def get_profiles(self):
+        """Get names of the named profiles"""
+        return [section[len(PROFILE_PREFIX):] for section in self.config.sections() if section.startswith(PROFILE_PREFIX)]
+    
+    def get_active_profile(self):
+        """Get the active profile name ('' for the base settings)"""
+        return self.active_profile
+    
+    def select_profile(self, name):
+        """Make a profile active ('' for the base settings).
+        
+        Only memory is touched; the choice is written by the next save or
+        flush(), so switching stays off the disk.
+        """
+        if name and PROFILE_PREFIX + name not in self.config:
+            raise KeyError(f"Unknown profile: {name}")
+        if 'Profiles' not in self.config:
+            self.config['Profiles'] = {}
+        self.config['Profiles']['active'] = name
+        self._resolve_profile()
+        self._pending_profile = name
+        self._dirty = True
+    
+    def create_profile(self, name):
+        """Create an empty profile, which starts out with the base settings"""
+        section = PROFILE_PREFIX + name
         if section not in self.config:
             self.config[section] = {}
-        self.config[section][key] = str(value)
-        self.save_config()
+            self._dirty = True
+            if self._batch_depth == 0:
+                self.save_config()
+    
+    def get_profile_hotkey(self, name):
+        """Get the hotkey that switches to a profile"""
+        return self.config.get(PROFILE_PREFIX + name, 'hotkey', fallback='').strip()
+    
+    def _profile_value(self, profile, section, key, fallback):
+        """Value of a key as seen with the given profile active"""
+        overrides = self.config[PROFILE_PREFIX + profile] if profile and PROFILE_PREFIX + profile in self.config else None
+        if overrides is not None and key in overrides:
+            return overrides.get(key)
+        return self.config.get(section, key, fallback=fallback)
+    
+    def get_backend_settings(self, profile):
+        """Settings that decide which backend a profile needs, as a hashable tuple.
+        
+        Profiles with equal tuples can share one backend and its
+        connection pool or loaded model.
+        """
+        def value(section, key, fallback):
+            return self._profile_value(profile, section, key, fallback)
+        
+        if value('OpenAI', 'backend', 'remote').lower() == 'local':
+            return (
+                'local', '', '',
+                value('Local', 'model_path', ''),
+                _parse_int(value('Local', 'context_size', '4096'), 4096, minimum=512),
+                _parse_int(value('Local', 'gpu_layers', '0'), 0),
+            )
+        return ('remote', value('OpenAI', 'base_url', 'https://api.openai.com/v1/'), value('OpenAI', 'api_key', ''), '', 0, 0)
     
     def get_api_key(self):
         """Get OpenAI API key"""
@@ -99,6 +282,161 @@ class Config:
         """Set OpenAI model"""
         self.set('OpenAI', 'model', model)
     
+    def get_stop_patterns(self):
+        """Get names of client-side stop patterns (code_block, paragraph)"""
+        value = self.get('OpenAI', 'stop_after', '')
+        return [name.strip().lower() for name in value.split(',') if name.strip()]
+    
+    def set_stop_patterns(self, names):
+        """Set client-side stop patterns"""
+        self.set('OpenAI', 'stop_after', ', '.join(names))
+    
+    def get_system_prompt(self):
+        """Get persistent system prompt"""
+        return self.get('OpenAI', 'system_prompt', '')
+    
+    def set_system_prompt(self, prompt):
+        """Set persistent system prompt"""
+        # Escape '%' so configparser interpolation leaves the prompt untouched
+        self.set('OpenAI', 'system_prompt', prompt.replace('%', '%%'))
+    
+    def get_prefix_cache_mode(self):
+        """Get prompt prefix caching mode (auto, openai, llamacpp, off)"""
+        return self.get('OpenAI', 'prefix_cache', 'auto').lower()
+    
+    def set_prefix_cache_mode(self, mode):
+        """Set prompt prefix caching mode"""
+        self.set('OpenAI', 'prefix_cache', mode)
+    
+    def is_prewarm_enabled(self):
+        """Check if connections are pre-warmed when the window is shown"""
+        return self.get('OpenAI', 'prewarm', 'true').lower() == 'true'
+    
+    def set_prewarm_enabled(self, enabled):
+        """Set pre-warm enabled state"""
+        self.set('OpenAI', 'prewarm', str(enabled).lower())
+    
+    def get_prewarm_interval(self):
+        """Get minimum seconds between pre-warm requests"""
+        try:
+            return max(0.0, float(self.get('OpenAI', 'prewarm_interval', '120')))
+        except ValueError:
+            return 120.0
+    
+    def get_backend(self):
+        """Get completion backend (remote or local)"""
+        return self.get('OpenAI', 'backend', 'remote').lower()
+    
+    def set_backend(self, backend):
+        """Set completion backend"""
+        self.set('OpenAI', 'backend', backend)
+    
+    def get_local_model_path(self):
+        """Get path of the GGUF model used by the local backend"""
+        return self.get('Local', 'model_path', '')
+    
+    def set_local_model_path(self, path):
+        """Set local model path"""
+        self.set('Local', 'model_path', path.replace('%', '%%'))
+    
+    def get_local_context_size(self):
+        """Get context window size in tokens for the local model"""
+        return _parse_int(self.get('Local', 'context_size', '4096'), 4096, minimum=512)
+    
+    def get_local_gpu_layers(self):
+        """Get number of local model layers offloaded to the GPU (-1 for all)"""
+        return _parse_int(self.get('Local', 'gpu_layers', '0'), 0)
+    
+    def get_compare_models(self):
+        """Get comma-separated models for compare mode ("model" or "model@base_url")"""
+        return self.get('Compare', 'models', '')
+    
+    def set_compare_models(self, models):
+        """Set models for compare mode"""
+        self.set('Compare', 'models', models)
+    
+    def get_compare_api_key(self, host):
+        """Get the API key for a compare mode endpoint on another host ([CompareKeys] host = key)"""
+        return self.get('CompareKeys', host.lower(), '')
+    
+    def is_retrieval_enabled(self):
+        """Check if relevant past chats are retrieved and sent as context"""
+        return self.get('Retrieval', 'enabled', 'false').lower() == 'true'
+    
+    def set_retrieval_enabled(self, enabled):
+        """Set retrieval enabled state"""
+        self.set('Retrieval', 'enabled', str(enabled).lower())
+    
+    def get_embedding_model(self):
+        """Get embedding model used to index past chats"""
+        return self.get('Retrieval', 'embedding_model', 'text-embedding-3-small')
+    
+    def set_embedding_model(self, model):
+        """Set embedding model"""
+        self.set('Retrieval', 'embedding_model', model)
+    
+    def get_retrieval_top_k(self):
+        """Get maximum number of past exchanges sent as context"""
+        try:
+            return max(1, int(self.get('Retrieval', 'top_k', '3')))
+        except ValueError:
+            return 3
+    
+    def get_retrieval_min_score(self):
+        """Get minimum cosine similarity for a past exchange to be sent"""
+        try:
+            return float(self.get('Retrieval', 'min_score', '0.4'))
+        except ValueError:
+            return 0.4
+    
+    def is_compaction_enabled(self):
+        """Check if old turns are summarized in the background while idle"""
+        return self.get('Compaction', 'enabled', 'false').lower() == 'true'
+    
+    def set_compaction_enabled(self, enabled):
+        """Set compaction enabled state"""
+        self.set('Compaction', 'enabled', str(enabled).lower())
+    
+    def get_compaction_model(self):
+        """Get model used for summaries ('' for the chat model)"""
+        return self.get('Compaction', 'model', '').strip()
+    
+    def set_compaction_model(self, model):
+        """Set compaction model"""
+        self.set('Compaction', 'model', model)
+    
+    def get_compaction_trigger_chars(self):
+        """Get size of unsummarized history, in characters, that triggers a compaction"""
+        return _parse_int(self.get('Compaction', 'trigger_chars', '16000'), 16000, minimum=1000)
+    
+    def get_compaction_keep_messages(self):
+        """Get number of newest messages that are never summarized"""
+        return _parse_int(self.get('Compaction', 'keep_messages', '6'), 6, minimum=2)
+    
+    def is_proxy_enabled(self):
+        """Check if the local OpenAI-compatible endpoint is served"""
+        return self.get('Proxy', 'enabled', 'false').lower() == 'true'
+    
+    def get_proxy_port(self):
+        """Get port of the local endpoint"""
+        port = _parse_int(self.get('Proxy', 'port', '8765'), 8765, minimum=1)
+        return port if port <= 65535 else 8765
+    
+    def get_cassette_mode(self):
+        """Get cassette mode (off, record or replay)"""
+        return self.get('Cassette', 'mode', 'off').strip().lower()
+    
+    def get_cassette_path(self):
+        """Get directory holding recorded request/response cassettes"""
+        return self.get('Cassette', 'path', '').strip() or str(self.config_dir / 'cassettes')
+    
+    def get_cassette_time_scale(self):
+        """Get multiplier applied to recorded timings on replay (0 replays instantly)"""
+        try:
+            return max(0.0, float(self.get('Cassette', 'time_scale', '1.0')))
+        except ValueError:
+            return 1.0
+    
     def get_window_geometry(self):
         """Get window geometry"""
         width = self.get('Window', 'width', '400')
@@ -109,10 +447,11 @@ class Config:
     
     def save_window_geometry(self, width, height, x, y):
         """Save window geometry"""
-        self.set('Window', 'width', width)
-        self.set('Window', 'height', height)
-        self.set('Window', 'x', x)
-        self.set('Window', 'y', y)
+        with self.batch():
+            self.set('Window', 'width', width)
+            self.set('Window', 'height', height)
+            self.set('Window', 'x', x)
+            self.set('Window', 'y', y)
     
     def get_toggle_hotkey(self):
         """Get toggle hotkey combination"""
@@ -176,4 +515,12 @@ class Config:
     
     def set_exit_hotkey_enabled(self, enabled):
         """Set exit hotkey enabled state"""
-        self.set('Hotkey', 'exit_enabled', str(enabled).lower())
\ No newline at end of file
+        self.set('Hotkey', 'exit_enabled', str(enabled).lower())
+
+def _parse_int(value, default, minimum=None):
+    """Parse an integer setting, falling back to default if it is malformed"""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(minimum, number) if minimum is not None else number
@@ -0,0 +1,79 @@
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+try:
+    # Optional: change notifications from the OS (inotify, ReadDirectoryChangesW, FSEvents)
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+POLL_INTERVAL_S = 2.0  # How often the file is stat'ed when OS notifications are unavailable
+
+def file_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    """Modification time and size of a file, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class _FileEvents(FileSystemEventHandler):
+    """Forwards events that touch one file; editors often save by renaming a temp file over it"""
+
+    def __init__(self, path: Path, on_change: Callable[[], None]):
+        self.path = os.path.normcase(str(path))
+        self.on_change = on_change
+
+    def on_any_event(self, event):
+        paths = (getattr(event, 'src_path', ''), getattr(event, 'dest_path', ''))
+        if any(path and os.path.normcase(str(path)) == self.path for path in paths):
+            self.on_change()
+
+class ConfigWatcher:
+    """Watches a file and calls on_change when it may have changed.
+
+    Uses OS change notifications through the optional watchdog package and
+    falls back to polling the file's modification time and size. on_change
+    is called from a background thread, possibly several times for one
+    save; callers debounce and compare contents.
+    """
+
+    def __init__(self, path: Path, on_change: Callable[[], None], poll_interval: float = POLL_INTERVAL_S):
+        self.path = Path(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._observer = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start watching in the background"""
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.daemon = True
+                self._observer.schedule(_FileEvents(self.path, self.on_change), str(self.path.parent), recursive=False)
+                self._observer.start()
+                return
+            except Exception as e:
+                # e.g. the inotify watch limit is reached
+                print(f"Warning: File notifications unavailable ({e}); polling config file instead")
+                self._observer = None
+        threading.Thread(target=self._poll, daemon=True).start()
+
+    def stop(self):
+        """Stop watching"""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def _poll(self):
+        last = file_stamp(self.path)
+        while not self._stop.wait(self.poll_interval):
+            stamp = file_stamp(self.path)
+            if stamp != last:
+                last = stamp
+                self.on_change()
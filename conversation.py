@@ -0,0 +1,154 @@
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+# Marker for "the current head", since None already means an empty branch
+_CURRENT_HEAD = object()
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+class Role(Enum):
+    """Message roles. Members are singletons, so records share one role object"""
+    USER = 'user'
+    ASSISTANT = 'assistant'
+    SYSTEM = 'system'
+    ERROR = 'error'
+    NOTICE = 'notice'
+
+    @property
+    def label(self) -> str:
+        """Sender name shown in the history window"""
+        return _ROLE_LABELS[self]
+
+    @property
+    def in_payload(self) -> bool:
+        """Whether messages with this role are sent to the API"""
+        return self in (Role.USER, Role.ASSISTANT, Role.SYSTEM)
+
+_ROLE_LABELS = {
+    Role.USER: "User",
+    Role.ASSISTANT: "AI",
+    Role.SYSTEM: "System",
+    Role.ERROR: "Error",
+    Role.NOTICE: "System",
+}
+
+class MessageNode:
+    """Single message record; the UI history and the API payload are both views of it"""
+    __slots__ = ('role', 'content', 'parent', 'in_payload')
+
+    def __init__(self, role: Role, content: str, parent: Optional['MessageNode'] = None):
+        self.role = role
+        self.content = content
+        self.parent = parent
+        # Cleared for questions whose request was terminated
+        self.in_payload = role.in_payload
+
+    def path(self) -> List['MessageNode']:
+        """Return nodes from the root down to this node"""
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+class Conversation:
+    """Conversation tree where branches share their common prefix.
+
+    Every message is stored once as a node pointing at its parent. A branch
+    is only a reference to its newest node, so forking or editing an earlier
+    turn never copies the history that came before it.
+    """
+
+    MAIN_BRANCH = "Main"
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Drop all branches and start an empty main branch"""
+        self.branches: Dict[str, Optional[MessageNode]] = {self.MAIN_BRANCH: None}
+        self.current_branch = self.MAIN_BRANCH
+        # Rolling summaries keyed by the newest node they cover. Branches
+        # sharing that node share the summary; the nodes themselves stay
+        # in the tree for the history view.
+        self.summaries: Dict[MessageNode, str] = {}
+
+    @property
+    def head(self) -> Optional[MessageNode]:
+        """Newest node of the current branch"""
+        return self.branches[self.current_branch]
+
+    def _set_head(self, node: Optional[MessageNode]):
+        self.branches[self.current_branch] = node
+
+    def append(self, role: Role, content: str) -> MessageNode:
+        """Append a message to the current branch"""
+        node = MessageNode(role, content, self.head)
+        self._set_head(node)
+        return node
+
+    def rewind(self, node: Optional[MessageNode]):
+        """Move the current branch back to node (None for an empty branch)"""
+        self._set_head(node)
+
+    def fork(self, at=_CURRENT_HEAD, name: Optional[str] = None) -> str:
+        """Create a branch sharing history up to `at` (default: current head) and switch to it"""
+        if at is _CURRENT_HEAD:
+            at = self.head
+        if not name:
+            index = len(self.branches) + 1
+            name = f"Branch {index}"
+            while name in self.branches:
+                index += 1
+                name = f"Branch {index}"
+        self.branches[name] = at
+        self.current_branch = name
+        return name
+
+    def switch(self, name: str):
+        """Switch to an existing branch"""
+        if name not in self.branches:
+            raise KeyError(f"Unknown branch: {name}")
+        self.current_branch = name
+
+    def last_node(self, role: Role) -> Optional[MessageNode]:
+        """Find the newest node with the given role on the current branch"""
+        node = self.head
+        while node is not None and node.role != role:
+            node = node.parent
+        return node
+
+    def nodes(self) -> List[MessageNode]:
+        """Nodes of the current branch, oldest first"""
+        return self.head.path() if self.head else []
+
+    def contains(self, fragment: str) -> bool:
+        """Check whether any message still sent on the current branch contains fragment"""
+        nodes = self.nodes()
+        start, _ = self.summary_point(nodes)
+        return any(fragment in node.content for node in nodes[start:] if node.in_payload)
+
+    def summary_point(self, nodes: List[MessageNode]) -> Tuple[int, Optional[str]]:
+        """Index of the first node after the newest summary on a path, and that summary"""
+        for index in range(len(nodes) - 1, -1, -1):
+            summary = self.summaries.get(nodes[index])
+            if summary is not None:
+                return index + 1, summary
+        return 0, None
+    
+    def messages(self) -> List[Dict[str, str]]:
+        """Flatten the current branch into an OpenAI messages payload.
+        
+        Nodes covered by a rolling summary are replaced by the summary.
+        """
+        nodes = self.nodes()
+        start, summary = self.summary_point(nodes)
+        payload = [{"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"}] if summary else []
+        payload.extend(
+            {"role": node.role.value, "content": node.content}
+            for node in nodes[start:]
+            if node.in_payload
+        )
+        return payload
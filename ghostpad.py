@@ -1,13 +1,30 @@
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import filedialog, messagebox, simpledialog
 import sys
 import os
-from typing import Optional, Set
+import threading
+import webbrowser
+from collections import deque
+from functools import partial
+from typing import Optional
 from pynput import keyboard
-from pynput.keyboard import Key, KeyCode
 
-from config import Config
-from api_client import OpenAIClient
+try:
+    # Optional: enables dropping files onto the pad
+    from tkinterdnd2 import DND_FILES, TkinterDnD
+except ImportError:
+    TkinterDnD = None
+
+import attachments
+from config import Config, PROFILE_PREFIX
+from config_watch import ConfigWatcher
+from api_client import OpenAIClient, STATE_CONNECTING, STATE_WAITING, STATE_STREAMING, STATE_RETRYING
+from backends import BACKEND_LOCAL, BACKEND_REMOTE
+from chunking import describe_size
+from conversation import Role
+from hotkeys import ActionQueue, HotkeyMatcher, parse_hotkey
+from proxy import ProxyServer
+from templates import load_templates, templates_path
 
 #Per aspera ad astra
 
@@ -17,8 +34,31 @@ LONG_PRESS_DELAY_MS = 350  # Milliseconds to wait before activating long press
 DRAG_THRESHOLD = 20  # Pixels of movement to cancel long press
 MIN_WINDOW_WIDTH = 200  # Minimum window width in pixels
 MIN_WINDOW_HEIGHT = 100  # Minimum window height in pixels
+FRAME_INTERVAL_MS = 16  # Drag/resize motion is applied at most once per frame
 ERROR_DISPLAY_DURATION_MS = 3000  # How long to show error messages
 TERMINATION_DISPLAY_DURATION_MS = 2000  # How long to show termination messages
+LARGE_PASTE_CHARS = 50000  # Pastes above this size are summarized instead of inserted
+DEFAULT_LARGE_INPUT_INSTRUCTION = "Summarize the pasted text."
+HOTKEY_POLL_MS = 20  # How often queued hotkey actions are picked up on the Tk thread
+EDIT_MENU_QUESTIONS = 10  # Newest questions offered in the Edit Question menu; History reaches the rest
+EDIT_MENU_LABEL_CHARS = 40
+LOADING_TICK_MS = 50  # Streamed text is flushed to the widget at most this often
+INDICATOR_TICKS = 4  # The loading indicator is redrawn every 4th tick (200 ms)
+LOADING_COLORS = {
+    STATE_CONNECTING: 'gray',
+    STATE_WAITING: '#2196F3',
+    STATE_STREAMING: '#4CAF50',
+    STATE_RETRYING: '#FF9800',
+}
+CONFIG_RELOAD_DELAY_MS = 300  # Wait for a burst of file writes to settle before reloading
+PROFILE_SAVE_DELAY_MS = 5000  # The active profile is written to disk this long after a switch
+IDLE_COMPACT_MS = 20000  # Idle time after a reply before old turns are compacted
+# Settings that require a new backend when config.ini changes
+CLIENT_SETTINGS = {
+    ('OpenAI', 'api_key'), ('OpenAI', 'base_url'), ('OpenAI', 'backend'),
+    ('Local', 'model_path'), ('Local', 'context_size'), ('Local', 'gpu_layers'),
+    ('Cassette', 'mode'), ('Cassette', 'path'), ('Cassette', 'time_scale'),
+}
 
 def resource_path(rel_path: str) -> str:
     """Get absolute path to resource, for PyInstaller"""
@@ -43,30 +83,64 @@ class GhostPad:
         self.long_press_timer = None
         self.long_press_active = False
         
+        # Last known geometry [width, height, x, y], kept instead of querying Tk
+        self.window_geometry = None
+        self.text_size = (0, 0)
+        self.geometry_flush_timer = None
+        self.current_cursor = ''
+        
         # Text state
         self.is_waiting = False
         self.original_text = ""
         self.loading_frame = None
+        self.loading_label = None
         self.loading_squares = []
+        self.loading_timer = None
+        self.loading_tick = 0
+        self.loading_state = (STATE_CONNECTING, "")
+        self.pending_deltas = deque()  # Streamed (generation, text) not yet shown
+        self.request_generation = 0  # Bumped per request; callbacks of older requests are dropped
+        self.stream_started = False
+        
+        self.idle_timer = None  # Starts background compaction once the pad is idle
+        
+        # Large pasted input, kept out of the text widget
+        self.large_input = None
+        self.large_input_marker = None
+        
+        # Files and clipboard text attached to the next message
+        self.attachments = attachments.AttachmentSet()
         
-        # Chat history
-        self.chat_history = []
+        # Secondary windows, built on first use and hidden instead of destroyed
+        self.secondary_windows = {}  # name -> (Toplevel, refresh callback)
         
         # Hotkey state
         self.is_hidden = False
         self.hotkey_listener = None
-        self.pressed_keys = set()
+        self.hotkey_matcher = HotkeyMatcher()
+        self.hotkey_actions = ActionQueue(self.root.report_callback_exception)
         
-        # Hotkey combinations
-        self.toggle_hotkey_combo = set()
-        self.send_hotkey_combo = set()
-        self.terminate_hotkey_combo = set()
-        self.exit_hotkey_combo = set()
+        # Prompt templates, compiled once at load time
+        self.templates = load_templates(self.config.config_dir)
         
         self.setup_window()
         self.create_widgets()
         self.bind_events()
         self.setup_hotkey()
+        self._poll_hotkey_actions()
+        
+        if self.config.is_prewarm_enabled():
+            self.api_client.prewarm_async()
+        
+        # Apply edits made to config.ini outside the app
+        self.config_reload_timer = None
+        self.profile_save_timer = None
+        self.config_watcher = ConfigWatcher(self.config.config_file, self.on_config_file_changed)
+        self.config_watcher.start()
+        
+        # Optional OpenAI-compatible endpoint for other local tools
+        self.proxy = None
+        self.update_proxy()
     
     def set_window_icon(self, window):
         """Set icon for a window (works for both Tk and Toplevel)"""
@@ -95,6 +169,7 @@ class GhostPad:
         # Set window geometry
         width, height, x, y = self.config.get_window_geometry()
         self.root.geometry(f"{width}x{height}+{x}+{y}")
+        self.window_geometry = [width, height, x, y]
         
         # Always on top
         self.root.attributes('-topmost', True)
@@ -134,6 +209,16 @@ class GhostPad:
         )
         self.loading_frame.place(relx=1.0, rely=1.0, anchor='se', x=-5, y=-5)
         
+        # Request state, e.g. "streaming 42 tok/s"
+        self.loading_label = tk.Label(
+            self.loading_frame,
+            text="",
+            bg='white',
+            fg='gray',
+            font=('Arial', 7)
+        )
+        self.loading_label.pack(side=tk.LEFT, padx=(0, 3))
+        
         # Three loading squares
         self.loading_squares = []
         for i in range(3):
@@ -159,6 +244,7 @@ class GhostPad:
         # Text widget events
         self.text_widget.bind('<KeyRelease>', self.on_text_change)
         self.text_widget.bind('<Button-3>', self.show_context_menu)  # Right-click
+        self.text_widget.bind('<<Paste>>', self.on_paste)
         
         # Window border events for dragging/resizing
         self.root.bind('<B1-Motion>', self.on_mouse_drag)
@@ -169,144 +255,74 @@ class GhostPad:
         self.text_widget.bind('<ButtonRelease-1>', self.on_text_release)
         self.text_widget.bind('<Motion>', self.on_text_motion)
         
+        # Track geometry so motion handlers never have to query it
+        self.root.bind('<Configure>', self.on_window_configure)
+        self.text_widget.bind('<Configure>', self.on_text_configure)
+        
         # Window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
+        # File drops, when tkdnd is available
+        if TkinterDnD is not None:
+            try:
+                TkinterDnD._require(self.root)
+                self.text_widget.drop_target_register(DND_FILES)
+                self.text_widget.dnd_bind('<<Drop>>', self.on_file_drop)
+            except (tk.TclError, AttributeError):
+                pass
     
     def setup_hotkey(self):
         """Setup global hotkey listener"""
         if self.hotkey_listener:
             self.hotkey_listener.stop()
         
-        # Parse all hotkey combinations
+        # Compile all enabled hotkeys into one lookup table
+        self.hotkey_matcher.clear()
         if self.config.is_toggle_hotkey_enabled():
-            self.toggle_hotkey_combo = self.parse_hotkey(self.config.get_toggle_hotkey())
-        else:
-            self.toggle_hotkey_combo = set()
-            
+            self.hotkey_matcher.add(self.config.get_toggle_hotkey(), self.toggle_window)
         if self.config.is_send_hotkey_enabled():
-            self.send_hotkey_combo = self.parse_hotkey(self.config.get_send_hotkey())
-        else:
-            self.send_hotkey_combo = set()
-            
+            self.hotkey_matcher.add(self.config.get_send_hotkey(), self.send_message_via_hotkey)
         if self.config.is_terminate_hotkey_enabled():
-            self.terminate_hotkey_combo = self.parse_hotkey(self.config.get_terminate_hotkey())
-        else:
-            self.terminate_hotkey_combo = set()
-            
+            # Only acts while waiting for a response
+            self.hotkey_matcher.add(self.config.get_terminate_hotkey(), self.terminate_current_request)
         if self.config.is_exit_hotkey_enabled():
-            self.exit_hotkey_combo = self.parse_hotkey(self.config.get_exit_hotkey())
-        else:
-            self.exit_hotkey_combo = set()
+            self.hotkey_matcher.add(self.config.get_exit_hotkey(), self.on_closing)
+        for template in self.templates:
+            if template.hotkey:
+                self.hotkey_matcher.add(template.hotkey, partial(self.run_template, template))
+        for profile in self.config.get_profiles():
+            hotkey = self.config.get_profile_hotkey(profile)
+            if hotkey:
+                self.hotkey_matcher.add(hotkey, partial(self.select_profile, profile))
         
         # Start listener if any hotkeys are enabled
-        if (self.config.is_toggle_hotkey_enabled() or 
-            self.config.is_send_hotkey_enabled() or 
-            self.config.is_terminate_hotkey_enabled() or
-            self.config.is_exit_hotkey_enabled()):
+        if self.hotkey_matcher:
             self.hotkey_listener = keyboard.Listener(
                 on_press=self.on_hotkey_press,
                 on_release=self.on_hotkey_release
             )
             self.hotkey_listener.start()
     
-    def parse_hotkey(self, hotkey_str: str) -> Set:
-        """Parse hotkey string into set of keys"""
-        keys: Set = set()
-        parts = [part.strip().lower() for part in hotkey_str.split('+')]
-        
-        # Mapping of special keys
-        special_keys = {
-            'ctrl': (Key.ctrl_l, Key.ctrl_r),
-            'alt': (Key.alt_l, Key.alt_r),
-            'shift': (Key.shift_l, Key.shift_r),
-            'esc': (Key.esc,),
-            'space': (Key.space,),
-            'enter': (Key.enter,),
-            'tab': (Key.tab,),
-            'backspace': (Key.backspace,),
-        }
-        
-        for part in parts:
-            if part in special_keys:
-                # Add all variants for modifier keys
-                for key in special_keys[part]:
-                    keys.add(key)
-            elif len(part) == 1:
-                # Single character key
-                keys.add(KeyCode.from_char(part))
-            # Note: f1-f12 keys are handled in validate_hotkey but not parsed here
-            # This is a limitation that could be improved in the future
-        
-        return keys
+    def _poll_hotkey_actions(self):
+        """Run hotkey actions queued by the listener thread, which never touches Tk itself"""
+        self.hotkey_actions.drain()
+        self.root.after(HOTKEY_POLL_MS, self._poll_hotkey_actions)
     
     def on_hotkey_press(self, key):
         """Handle hotkey press"""
         try:
-            self.pressed_keys.add(key)
-            
-            # Check toggle hotkey
-            if self.toggle_hotkey_combo and self.check_hotkey_match(self.toggle_hotkey_combo):
-                self.root.after(0, self.toggle_window)
-            
-            # Check send hotkey
-            if self.send_hotkey_combo and self.check_hotkey_match(self.send_hotkey_combo):
-                self.root.after(0, self.send_message_via_hotkey)
-            
-            # Check terminate hotkey (only when waiting for response)
-            if (self.terminate_hotkey_combo and 
-                self.check_hotkey_match(self.terminate_hotkey_combo) and 
-                self.is_waiting):
-                self.root.after(0, self.terminate_current_request)
-            
-            # Check exit hotkey
-            if self.exit_hotkey_combo and self.check_hotkey_match(self.exit_hotkey_combo):
-                self.root.after(0, self.on_closing)
-                
+            actions = self.hotkey_matcher.press(key)
+            if actions:
+                self.hotkey_actions.put(actions)
         except Exception as e:
             # Silently ignore hotkey errors to prevent UI blocking
             # Hotkey listener errors are non-critical
             pass
     
-    def check_hotkey_match(self, target_keys: Set) -> bool:
-        """Check if current pressed keys match target hotkey combination"""
-        if not target_keys:
-            return False
-            
-        # For single key hotkeys, check direct match
-        if len(target_keys) == 1:
-            return any(key in self.pressed_keys for key in target_keys)
-        
-        # For combination hotkeys, check if all required keys are pressed
-        # Account for left/right variants of modifier keys
-        required_modifiers = 0
-        pressed_modifiers = 0
-        
-        # Count required and pressed modifier keys
-        for target_key in target_keys:
-            if target_key in [Key.ctrl_l, Key.ctrl_r]:
-                required_modifiers += 1
-                if Key.ctrl_l in self.pressed_keys or Key.ctrl_r in self.pressed_keys:
-                    pressed_modifiers += 1
-            elif target_key in [Key.alt_l, Key.alt_r]:
-                required_modifiers += 1
-                if Key.alt_l in self.pressed_keys or Key.alt_r in self.pressed_keys:
-                    pressed_modifiers += 1
-            elif target_key in [Key.shift_l, Key.shift_r]:
-                required_modifiers += 1
-                if Key.shift_l in self.pressed_keys or Key.shift_r in self.pressed_keys:
-                    pressed_modifiers += 1
-            else:
-                # Regular key - check direct match
-                if target_key not in self.pressed_keys:
-                    return False
-        
-        # All modifiers must be pressed
-        return pressed_modifiers >= required_modifiers
-    
     def on_hotkey_release(self, key):
         """Handle hotkey release"""
         try:
-            self.pressed_keys.discard(key)
+            self.hotkey_matcher.release(key)
         except Exception as e:
             # Silently ignore hotkey errors to prevent UI blocking
             pass
@@ -324,13 +340,26 @@ class GhostPad:
             text_content = self.text_widget.get(1.0, tk.END).strip()
             if text_content:
                 self.original_text = text_content
-                self.send_to_api(text_content)
+                pending = self.attachments.present_in(text_content)
+                if pending:
+                    message = attachments.build_message(
+                        self.attachments.strip_markers(text_content),
+                        pending,
+                        self.api_client.conversation.contains
+                    )
+                    self.send_to_api(message)
+                elif self.large_input and self.large_input_marker in text_content:
+                    instruction = text_content.replace(self.large_input_marker, '').strip()
+                    self.send_large_input(instruction or DEFAULT_LARGE_INPUT_INSTRUCTION)
+                else:
+                    self.send_to_api(text_content)
     
     def terminate_current_request(self):
         """Terminate current API request"""
         if self.is_waiting:
-            # Set termination flag
+            # Set termination flag; whatever the request still reports is ignored
             self.api_client.terminate_current_request()
+            self.request_generation += 1
             
             # Immediately handle termination
             self.root.after(0, self._handle_termination)
@@ -351,7 +380,7 @@ class GhostPad:
             self.is_resizing = True
         else:
             self.is_dragging = True
-        self.root.configure(cursor='fleur')  # Change cursor to indicate drag mode
+        self._set_cursor('fleur')  # Change cursor to indicate drag mode
     
     def cancel_long_press_timer(self):
         """Cancel long press timer"""
@@ -361,7 +390,23 @@ class GhostPad:
         self.long_press_active = False
         self.initial_click_x = 0
         self.initial_click_y = 0
-        self.root.configure(cursor='')
+        self._set_cursor('')
+    
+    def _set_cursor(self, cursor):
+        """Change the cursor only when it differs from the current one"""
+        if cursor != self.current_cursor:
+            self.current_cursor = cursor
+            self.root.configure(cursor=cursor)
+    
+    def on_window_configure(self, event):
+        """Cache the window geometry when Tk reports a change"""
+        # While dragging, the cache is ahead of Tk and must not be overwritten
+        if event.widget is self.root and not self.long_press_active:
+            self.window_geometry = [event.width, event.height, event.x, event.y]
+    
+    def on_text_configure(self, event):
+        """Cache the text widget size"""
+        self.text_size = (event.width, event.height)
     
     def on_text_motion(self, event):
         """Handle mouse motion on text widget"""
@@ -370,29 +415,27 @@ class GhostPad:
             
         # Get position relative to text widget
         x, y = event.x, event.y
-        width = self.text_widget.winfo_width()
-        height = self.text_widget.winfo_height()
+        width, height = self.text_size
         border_threshold = BORDER_THRESHOLD
         
-        # Check if we're near a corner (for resizing)
-        if ((x < border_threshold and y < border_threshold) or 
-            (x > width - border_threshold and y < border_threshold) or
-            (x < border_threshold and y > height - border_threshold) or
-            (x > width - border_threshold and y > height - border_threshold)):
-            # Show resize cursor
-            if x < border_threshold and y < border_threshold:
-                self.root.configure(cursor='top_left_corner')
-            elif x > width - border_threshold and y < border_threshold:
-                self.root.configure(cursor='top_right_corner')
-            elif x < border_threshold and y > height - border_threshold:
-                self.root.configure(cursor='bottom_left_corner')
-            elif x > width - border_threshold and y > height - border_threshold:
-                self.root.configure(cursor='bottom_right_corner')
-        elif x < border_threshold or x > width - border_threshold or y < border_threshold or y > height - border_threshold:
-            # Near edges but not corners - show move cursor
-            self.root.configure(cursor='fleur')
+        near_left = x < border_threshold
+        near_right = x > width - border_threshold
+        near_top = y < border_threshold
+        near_bottom = y > height - border_threshold
+        
+        # Corners resize, edges move
+        if near_left and near_top:
+            self._set_cursor('top_left_corner')
+        elif near_right and near_top:
+            self._set_cursor('top_right_corner')
+        elif near_left and near_bottom:
+            self._set_cursor('bottom_left_corner')
+        elif near_right and near_bottom:
+            self._set_cursor('bottom_right_corner')
+        elif near_left or near_right or near_top or near_bottom:
+            self._set_cursor('fleur')
         else:
-            self.root.configure(cursor='')
+            self._set_cursor('')
     
     def on_mouse_drag(self, event):
         """Handle mouse drag on window (for moving/resizing)"""
@@ -415,15 +458,28 @@ class GhostPad:
             self.handle_resize(dx, dy)
         else:
             # Moving
-            x = self.root.winfo_x() + dx
-            y = self.root.winfo_y() + dy
-            self.root.geometry(f"+{x}+{y}")
+            self.window_geometry[2] += dx
+            self.window_geometry[3] += dy
+        
+        # Apply accumulated motion once per frame
+        if self.geometry_flush_timer is None:
+            self.geometry_flush_timer = self.root.after(FRAME_INTERVAL_MS, self._flush_geometry)
         
         self.drag_start_x = event.x_root
         self.drag_start_y = event.y_root
     
+    def _flush_geometry(self):
+        """Apply the cached geometry to the window"""
+        if self.geometry_flush_timer is not None:
+            self.root.after_cancel(self.geometry_flush_timer)
+            self.geometry_flush_timer = None
+        width, height, x, y = self.window_geometry
+        self.root.geometry(f"{width}x{height}+{x}+{y}")
+    
     def on_mouse_release(self, event):
         """Handle mouse release"""
+        if self.geometry_flush_timer is not None:
+            self._flush_geometry()
         self.cancel_long_press_timer()
         self.resize_mode = None
         self.is_dragging = False
@@ -475,6 +531,8 @@ class GhostPad:
     
     def on_text_release(self, event):
         """Handle release on text widget"""
+        if self.geometry_flush_timer is not None:
+            self._flush_geometry()
         self.cancel_long_press_timer()
         self.is_dragging = False
         self.is_resizing = False
@@ -482,10 +540,7 @@ class GhostPad:
     
     def handle_resize(self, dx, dy):
         """Handle window resizing"""
-        current_width = self.root.winfo_width()
-        current_height = self.root.winfo_height()
-        current_x = self.root.winfo_x()
-        current_y = self.root.winfo_y()
+        current_width, current_height, current_x, current_y = self.window_geometry
         
         new_width = current_width
         new_height = current_height
@@ -514,10 +569,15 @@ class GhostPad:
             if new_height > MIN_WINDOW_HEIGHT:
                 new_y = current_y + dy
         
-        self.root.geometry(f"{new_width}x{new_height}+{new_x}+{new_y}")
+        # Applied by the next frame flush
+        self.window_geometry = [new_width, new_height, new_x, new_y]
     
     def on_text_change(self, event):
         """Handle text change - only handle normal Enter now"""
+        # New input: background work yields and waits for the next idle period
+        if self.idle_timer is not None:
+            self._schedule_idle_work()
+        self.api_client.cancel_compaction()
         if event.keysym == 'Return':
             # Normal Enter - just insert newline (default behavior)
             return None
@@ -529,47 +589,266 @@ class GhostPad:
         
         self.is_waiting = True
         
-        # Add user message to chat history
-        self.chat_history.append(("User", message))
-        
-        # Show loading indicator (keep text in place)
-        self.loading_frame.place(relx=1.0, rely=1.0, anchor='se', x=-5, y=-5)
+        # Show loading indicator (keep text in place until the first token)
+        self._start_loading()
         
         # Send to API
-        self.api_client.send_message_async(
-            message,
-            self.on_api_response,
-            self.on_api_error
+        self.api_client.send_message_async(message, *self._request_callbacks())
+    
+    def on_paste(self, event):
+        """Divert large clipboard pastes into large-input mode"""
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            return None
+        if len(text) < LARGE_PASTE_CHARS:
+            return None  # Let Tk paste normally
+        
+        # Measure the text off the UI thread, then show a preview instead of the text
+        threading.Thread(target=self._ingest_large_input, args=(text,), daemon=True).start()
+        return "break"
+    
+    def _ingest_large_input(self, text):
+        """Prepare a large paste for sending (runs in a worker thread)"""
+        description = describe_size(text)
+        self.root.after(0, lambda: self._show_large_input_preview(text, description))
+    
+    def _show_large_input_preview(self, text, description):
+        """Insert a size preview that stands in for the pasted text"""
+        if self.large_input_marker:
+            # Only one large input at a time; drop the old preview
+            self.text_widget.replace(1.0, tk.END, self.text_widget.get(1.0, 'end-1c').replace(self.large_input_marker, ''))
+        self.large_input = (text, description)
+        self.large_input_marker = f"[Pasted text: {description}]"
+        self.text_widget.insert(tk.INSERT, self.large_input_marker)
+    
+    def run_template(self, template):
+        """Fill a prompt template and send it right away"""
+        if self.is_waiting:
+            return
+        message = template.render({
+            'selection': self._get_selection_text,
+            'clipboard': self._get_clipboard_text,
+            'text': lambda: self.text_widget.get(1.0, 'end-1c').strip(),
+        })
+        if not message:
+            return
+        
+        self.show_window()
+        self.text_widget.delete(1.0, tk.END)
+        self.text_widget.insert(1.0, message)
+        self.text_widget.configure(fg='black')
+        self.original_text = message
+        self.send_to_api(message)
+    
+    def _get_clipboard_text(self):
+        """Clipboard text, or empty if the clipboard holds no text"""
+        try:
+            return self.root.clipboard_get()
+        except tk.TclError:
+            return ""
+    
+    def _get_selection_text(self):
+        """Selected text in the pad, else the system selection, else the clipboard"""
+        try:
+            return self.text_widget.get(tk.SEL_FIRST, tk.SEL_LAST)
+        except tk.TclError:
+            pass
+        if sys.platform != "win32":
+            try:
+                return self.root.selection_get(selection='PRIMARY')
+            except tk.TclError:
+                pass
+        return self._get_clipboard_text()
+    
+    def open_templates_file(self):
+        """Open the templates file in the default editor"""
+        path = str(templates_path(self.config.config_dir))
+        if sys.platform == "win32":
+            os.startfile(path)
+        else:
+            webbrowser.open(f"file://{path}")
+    
+    def reload_templates(self):
+        """Reload templates from disk and rebind their hotkeys"""
+        self.templates = load_templates(self.config.config_dir)
+        self.setup_hotkey()
+    
+    def attach_files(self):
+        """Pick files to attach to the next message"""
+        paths = filedialog.askopenfilenames(parent=self.root, title="Attach Files")
+        for path in paths:
+            self._load_attachment(path)
+    
+    def attach_clipboard(self):
+        """Attach the clipboard text to the next message"""
+        try:
+            text = self.root.clipboard_get()
+        except tk.TclError:
+            return
+        if text:
+            self._add_attachment(attachments.from_text("clipboard", text))
+    
+    def on_file_drop(self, event):
+        """Attach files dropped onto the pad"""
+        for path in self.root.tk.splitlist(event.data):
+            if os.path.isfile(path):
+                self._load_attachment(path)
+        return event.action
+    
+    def _load_attachment(self, path):
+        """Read a file in a worker thread, then attach it"""
+        def load():
+            try:
+                attachment = attachments.read_file(path)
+            except (IOError, OSError, ValueError) as e:
+                message = f"Could not attach {os.path.basename(path)}: {e}"
+                self.root.after(0, lambda: messagebox.showerror("Attach File", message))
+                return
+            self.root.after(0, lambda: self._add_attachment(attachment))
+        
+        threading.Thread(target=load, daemon=True).start()
+    
+    def _add_attachment(self, attachment):
+        """Show a placeholder for a new attachment; repeated content is ignored"""
+        if self.attachments.add(attachment):
+            self.text_widget.insert(tk.END, ("\n" if self.text_widget.get(1.0, 'end-1c').strip() else "") + attachment.marker)
+    
+    def send_large_input(self, instruction):
+        """Send the pending large input through map-reduce summarization"""
+        if self.is_waiting:
+            return
+        
+        self.is_waiting = True
+        self._start_loading()
+        
+        text, description = self.large_input
+        self.api_client.summarize_large_input_async(text, instruction, description, *self._request_callbacks())
+    
+    def _request_callbacks(self):
+        """Response, error, progress and delta callbacks bound to a new request.
+        
+        A request that was terminated or replaced may still report from its
+        thread; those reports are dropped instead of reaching the pad.
+        """
+        self.request_generation += 1
+        generation = self.request_generation
+        return (
+            partial(self.on_api_response, generation),
+            partial(self.on_api_error, generation),
+            partial(self.on_api_progress, generation),
+            partial(self.on_api_delta, generation),
         )
     
-    def on_api_response(self, response):
+    def _if_current(self, generation, handler, *args):
+        """Run a request's handler only if no newer request replaced it"""
+        if generation == self.request_generation:
+            handler(*args)
+    
+    def on_api_progress(self, generation, state, detail):
+        """Record request progress (request thread); shown by the loading timer"""
+        if generation == self.request_generation:
+            self.loading_state = (state, detail)
+    
+    def on_api_delta(self, generation, text):
+        """Queue streamed text (request thread); flushed by the loading timer"""
+        self.pending_deltas.append((generation, text))
+    
+    def _start_loading(self):
+        """Show the loading indicator and start its timer"""
+        self.loading_state = (STATE_CONNECTING, "")
+        self.pending_deltas.clear()
+        self.stream_started = False
+        self.loading_tick = 0
+        self.loading_frame.place(relx=1.0, rely=1.0, anchor='se', x=-5, y=-5)
+        self._render_loading_indicator()
+        if self.loading_timer is None:
+            self.loading_timer = self.root.after(LOADING_TICK_MS, self._on_loading_tick)
+    
+    def _stop_loading(self):
+        """Hide the loading indicator and cancel its timer"""
+        if self.loading_timer is not None:
+            self.root.after_cancel(self.loading_timer)
+            self.loading_timer = None
+        self.pending_deltas.clear()
+        self.loading_frame.place_forget()
+    
+    def _on_loading_tick(self):
+        """Flush streamed text and animate the indicator (one timer for both)"""
+        self.loading_timer = None
+        if not self.is_waiting:
+            return
+        
+        parts = []
+        while self.pending_deltas:
+            generation, text = self.pending_deltas.popleft()
+            if generation == self.request_generation:
+                parts.append(text)
+        if parts:
+            if not self.stream_started:
+                # First token: replace the question with the reply as it streams
+                self.stream_started = True
+                self.text_widget.delete(1.0, tk.END)
+                self.text_widget.configure(fg='black')
+            self.text_widget.insert(tk.END, ''.join(parts))
+            self.text_widget.see(tk.END)
+        
+        self.loading_tick += 1
+        if self.loading_tick % INDICATOR_TICKS == 0:
+            self._render_loading_indicator()
+        self.loading_timer = self.root.after(LOADING_TICK_MS, self._on_loading_tick)
+    
+    def _render_loading_indicator(self):
+        """Draw the current request state and animation frame"""
+        state, detail = self.loading_state
+        color = LOADING_COLORS.get(state, 'gray')
+        active = (self.loading_tick // INDICATOR_TICKS) % len(self.loading_squares)
+        for i, square in enumerate(self.loading_squares):
+            square.configure(fg=color if i == active else 'lightgray')
+        self.loading_label.configure(text=f"{state} {detail}".strip())
+    
+    def on_api_response(self, generation, response):
         """Handle API response"""
-        self.root.after(0, lambda: self._update_text_with_response(response))
+        self.root.after(0, self._if_current, generation, self._update_text_with_response, response)
     
-    def on_api_error(self, error):
+    def on_api_error(self, generation, error):
         """Handle API error"""
-        self.root.after(0, lambda: self._update_text_with_error(error))
+        self.root.after(0, self._if_current, generation, self._update_text_with_error, error)
     
     def _update_text_with_response(self, response):
         """Update text widget with API response"""
         # Hide loading indicator
-        self.loading_frame.place_forget()
+        self._stop_loading()
         
-        # Add AI response to chat history
-        self.chat_history.append(("AI", response))
+        # Large inputs and attachments are released once they have been answered
+        self.large_input = None
+        self.large_input_marker = None
+        self.attachments.clear()
         
         self.text_widget.delete(1.0, tk.END)
         self.text_widget.insert(1.0, response)
         self.text_widget.configure(fg='black')
         self.is_waiting = False
+        self._schedule_idle_work()
+    
+    def _schedule_idle_work(self):
+        """(Re)start the idle countdown that triggers background compaction"""
+        if self.idle_timer is not None:
+            self.root.after_cancel(self.idle_timer)
+        self.idle_timer = self.root.after(IDLE_COMPACT_MS, self._on_idle)
+    
+    def _on_idle(self):
+        self.idle_timer = None
+        if not self.is_waiting:
+            self.api_client.compact_async()
     
     def _update_text_with_error(self, error):
         """Update text widget with error message"""
         # Hide loading indicator
-        self.loading_frame.place_forget()
+        self._stop_loading()
         
         # Add error to chat history
-        self.chat_history.append(("Error", error))
+        self.api_client.add_note(Role.ERROR, error)
         
         self.text_widget.delete(1.0, tk.END)
         self.text_widget.insert(1.0, error)
@@ -590,10 +869,10 @@ class GhostPad:
         """Handle immediate termination response"""
         if self.is_waiting:
             # Hide loading indicator
-            self.loading_frame.place_forget()
+            self._stop_loading()
             
             # Add termination to chat history
-            self.chat_history.append(("System", "Successfully terminated"))
+            self.api_client.add_note(Role.NOTICE, "Successfully terminated")
             
             # Update text widget
             self.text_widget.delete(1.0, tk.END)
@@ -620,8 +899,57 @@ class GhostPad:
         
         context_menu.add_command(label="LLM Settings", command=self.show_llm_settings)
         context_menu.add_command(label="Set Hotkeys", command=self.set_hotkeys)
+        
+        # Profile switcher
+        active_profile = self.config.get_active_profile()
+        profile_menu = tk.Menu(context_menu, tearoff=0)
+        for name in [''] + self.config.get_profiles():
+            label = name or "Default"
+            hotkey = self.config.get_profile_hotkey(name) if name else ''
+            if hotkey:
+                label = f"{label}    {hotkey}"
+            label = f"• {label}" if name == active_profile else f"  {label}"
+            profile_menu.add_command(label=label, command=partial(self.select_profile, name))
+        profile_menu.add_separator()
+        profile_menu.add_command(label="New Profile...", command=self.new_profile)
+        context_menu.add_cascade(label="Profiles", menu=profile_menu)
+        context_menu.add_separator()
+        # Prompt templates
+        template_menu = tk.Menu(context_menu, tearoff=0)
+        for template in self.templates:
+            template_menu.add_command(
+                label=f"{template.name}    {template.hotkey}" if template.hotkey else template.name,
+                command=partial(self.run_template, template)
+            )
+        if self.templates:
+            template_menu.add_separator()
+        template_menu.add_command(label="Edit Templates...", command=self.open_templates_file)
+        template_menu.add_command(label="Reload Templates", command=self.reload_templates)
+        context_menu.add_cascade(label="Templates", menu=template_menu)
+        context_menu.add_command(label="Attach File...", command=self.attach_files)
+        context_menu.add_command(label="Attach Clipboard", command=self.attach_clipboard)
         context_menu.add_separator()
         context_menu.add_command(label="Start New Chat", command=self.start_new_chat)
+        
+        # Questions of the current branch, newest first, to re-ask from there
+        conversation = self.api_client.conversation
+        questions = [node for node in reversed(conversation.nodes()) if node.role == Role.USER]
+        edit_menu = tk.Menu(context_menu, tearoff=0)
+        for node in questions[:EDIT_MENU_QUESTIONS]:
+            label = ' '.join(node.content.split())
+            if len(label) > EDIT_MENU_LABEL_CHARS:
+                label = label[:EDIT_MENU_LABEL_CHARS - 1] + "…"
+            edit_menu.add_command(label=label, command=partial(self.edit_question, node))
+        context_menu.add_cascade(label="Edit Question", menu=edit_menu, state=tk.NORMAL if questions else tk.DISABLED)
+        context_menu.add_command(label="Fork Chat", command=self.fork_chat)
+        
+        # Branch switcher
+        branch_menu = tk.Menu(context_menu, tearoff=0)
+        for name in conversation.branches:
+            label = f"• {name}" if name == conversation.current_branch else f"  {name}"
+            branch_menu.add_command(label=label, command=lambda n=name: self.switch_branch(n))
+        context_menu.add_cascade(label="Branches", menu=branch_menu)
+        context_menu.add_command(label="Compare Models", command=self.compare_models)
         context_menu.add_command(label="History", command=self.show_history)
         context_menu.add_separator()
         context_menu.add_command(label="Help", command=self.show_help)
@@ -634,16 +962,45 @@ class GhostPad:
         finally:
             context_menu.grab_release()
     
+    def _show_secondary_window(self, name, build, modal=False):
+        """Show a secondary window, building it on first use.
+        
+        Closing only hides the window, so opening it again refreshes its
+        data instead of rebuilding the widget tree, and there is never more
+        than one window of each kind. build(window) fills the new Toplevel
+        and returns the callback that refreshes it.
+        """
+        entry = self.secondary_windows.get(name)
+        if entry is None or not entry[0].winfo_exists():
+            window = tk.Toplevel(self.root)
+            window.withdraw()
+            window.protocol("WM_DELETE_WINDOW", partial(self._hide_secondary_window, window))
+            entry = self.secondary_windows[name] = (window, build(window))
+        window, refresh = entry
+        refresh()
+        window.deiconify()
+        window.lift()
+        window.focus_force()
+        if modal:
+            window.grab_set()
+    
+    def _hide_secondary_window(self, window):
+        """Hide a secondary window so it can be shown again without rebuilding"""
+        window.grab_release()
+        window.withdraw()
+    
     def show_llm_settings(self):
         """Show LLM settings window"""
-        settings_window = tk.Toplevel(self.root)
+        self._show_secondary_window('settings', self._build_llm_settings, modal=True)
+    
+    def _build_llm_settings(self, settings_window):
+        """Build the LLM settings window and return its refresh callback"""
         self.set_window_icon(settings_window)
         settings_window.title("Settings")
         settings_window.geometry("500x600")
         settings_window.configure(bg='white')
         settings_window.attributes('-topmost', True)
         settings_window.transient(self.root)
-        settings_window.grab_set()
         
         # Center the window
         settings_window.update_idletasks()
@@ -687,9 +1044,8 @@ class GhostPad:
         api_frame.pack(fill=tk.X, pady=(0, 15))
         
         tk.Label(api_frame, text="API Key:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_key = self.config.get_api_key()
-        masked_key = f"{'*' * max(0, len(current_key) - 4)}{current_key[-4:]}" if current_key else "Not set"
-        tk.Label(api_frame, text=f"Current: {masked_key}", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        key_current_label = tk.Label(api_frame, font=('Arial', 9), bg='white', fg='gray')
+        key_current_label.pack(anchor='w')
         
         api_entry = tk.Entry(api_frame, font=('Arial', 10), show='*', width=50)
         api_entry.pack(fill=tk.X, pady=(5, 0))
@@ -699,25 +1055,65 @@ class GhostPad:
         url_frame.pack(fill=tk.X, pady=(0, 15))
         
         tk.Label(url_frame, text="Base URL:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_url = self.config.get_base_url()
-        tk.Label(url_frame, text=f"Current: {current_url}", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        url_current_label = tk.Label(url_frame, font=('Arial', 9), bg='white', fg='gray')
+        url_current_label.pack(anchor='w')
         
         url_entry = tk.Entry(url_frame, font=('Arial', 10), width=50)
         url_entry.pack(fill=tk.X, pady=(5, 0))
-        url_entry.insert(0, current_url)
         
         # Model section
         model_frame = tk.Frame(main_frame, bg='white')
         model_frame.pack(fill=tk.X, pady=(0, 20))
         
         tk.Label(model_frame, text="Model:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_model = self.config.get_model()
-        tk.Label(model_frame, text=f"Current: {current_model}", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        model_current_label = tk.Label(model_frame, font=('Arial', 9), bg='white', fg='gray')
+        model_current_label.pack(anchor='w')
         tk.Label(model_frame, text="Examples: gpt-4.1-mini, gpt-3.5-turbo, gpt-4", font=('Arial', 8), bg='white', fg='lightgray').pack(anchor='w')
         
         model_entry = tk.Entry(model_frame, font=('Arial', 10), width=50)
         model_entry.pack(fill=tk.X, pady=(5, 0))
-        model_entry.insert(0, current_model)
+        
+        # Backend section
+        backend_frame = tk.Frame(main_frame, bg='white')
+        backend_frame.pack(fill=tk.X, pady=(0, 20))
+        
+        tk.Label(backend_frame, text="Backend:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
+        tk.Label(backend_frame, text="Local runs a GGUF model in-process (needs llama-cpp-python)", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        
+        backend_var = tk.StringVar()
+        tk.Radiobutton(backend_frame, text="Remote (API key, base URL and model above)", variable=backend_var,
+                       value=BACKEND_REMOTE, bg='white', font=('Arial', 9)).pack(anchor='w')
+        tk.Radiobutton(backend_frame, text="Local model file", variable=backend_var,
+                       value=BACKEND_LOCAL, bg='white', font=('Arial', 9)).pack(anchor='w')
+        
+        local_path_frame = tk.Frame(backend_frame, bg='white')
+        local_path_frame.pack(fill=tk.X, pady=(2, 0))
+        
+        local_path_entry = tk.Entry(local_path_frame, font=('Arial', 10), width=40)
+        local_path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        def browse_model():
+            path = filedialog.askopenfilename(
+                parent=settings_window,
+                title="Local Model",
+                filetypes=[("GGUF models", "*.gguf"), ("All files", "*.*")]
+            )
+            if path:
+                local_path_entry.delete(0, tk.END)
+                local_path_entry.insert(0, path)
+                backend_var.set(BACKEND_LOCAL)
+        
+        tk.Button(local_path_frame, text="Browse...", command=browse_model, font=('Arial', 9)).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # System prompt section
+        system_frame = tk.Frame(main_frame, bg='white')
+        system_frame.pack(fill=tk.X, pady=(0, 20))
+        
+        tk.Label(system_frame, text="System Prompt:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
+        tk.Label(system_frame, text="Sent first in every request; kept unchanged so providers can cache it", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        
+        system_text = tk.Text(system_frame, font=('Arial', 10), width=50, height=4, wrap=tk.WORD)
+        system_text.pack(fill=tk.X, pady=(5, 0))
         
         # Advanced Settings Section
         advanced_label = tk.Label(main_frame, text="Advanced Settings", font=('Arial', 12, 'bold'), bg='white')
@@ -728,142 +1124,264 @@ class GhostPad:
         temp_frame.pack(fill=tk.X, pady=(0, 10))
         
         tk.Label(temp_frame, text="Temperature:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_temp = self.config.get('OpenAI', 'temperature', '1.0')
-        tk.Label(temp_frame, text=f"Current: {current_temp} | Controls randomness", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        temp_current_label = tk.Label(temp_frame, font=('Arial', 8), bg='white', fg='gray')
+        temp_current_label.pack(anchor='w')
         
         temp_entry = tk.Entry(temp_frame, font=('Arial', 10), width=20)
         temp_entry.pack(anchor='w', pady=(2, 0))
-        temp_entry.insert(0, current_temp)
         
         # Top P
         top_p_frame = tk.Frame(main_frame, bg='white')
         top_p_frame.pack(fill=tk.X, pady=(0, 10))
         
         tk.Label(top_p_frame, text="Top P:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_top_p = self.config.get('OpenAI', 'top_p', '1.0')
-        tk.Label(top_p_frame, text=f"Current: {current_top_p} | Limits randomness range", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        top_p_current_label = tk.Label(top_p_frame, font=('Arial', 8), bg='white', fg='gray')
+        top_p_current_label.pack(anchor='w')
         
         top_p_entry = tk.Entry(top_p_frame, font=('Arial', 10), width=20)
         top_p_entry.pack(anchor='w', pady=(2, 0))
-        top_p_entry.insert(0, current_top_p)
         
         # Max Tokens
         max_tokens_frame = tk.Frame(main_frame, bg='white')
         max_tokens_frame.pack(fill=tk.X, pady=(0, 10))
         
         tk.Label(max_tokens_frame, text="Max Tokens:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_max_tokens = self.config.get('OpenAI', 'max_tokens', '4096')
-        tk.Label(max_tokens_frame, text=f"Current: {current_max_tokens} | Maximum response length", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        max_tokens_current_label = tk.Label(max_tokens_frame, font=('Arial', 8), bg='white', fg='gray')
+        max_tokens_current_label.pack(anchor='w')
         
         max_tokens_entry = tk.Entry(max_tokens_frame, font=('Arial', 10), width=20)
         max_tokens_entry.pack(anchor='w', pady=(2, 0))
-        max_tokens_entry.insert(0, current_max_tokens)
         
         # Presence Penalty
         presence_frame = tk.Frame(main_frame, bg='white')
         presence_frame.pack(fill=tk.X, pady=(0, 10))
         
         tk.Label(presence_frame, text="Presence Penalty:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_presence = self.config.get('OpenAI', 'presence_penalty', '0.0')
-        tk.Label(presence_frame, text=f"Current: {current_presence} | Encourages new topics (positive values)", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        presence_current_label = tk.Label(presence_frame, font=('Arial', 8), bg='white', fg='gray')
+        presence_current_label.pack(anchor='w')
         
         presence_entry = tk.Entry(presence_frame, font=('Arial', 10), width=20)
         presence_entry.pack(anchor='w', pady=(2, 0))
-        presence_entry.insert(0, current_presence)
         
         # Frequency Penalty
         frequency_frame = tk.Frame(main_frame, bg='white')
         frequency_frame.pack(fill=tk.X, pady=(0, 10))
         
         tk.Label(frequency_frame, text="Frequency Penalty:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_frequency = self.config.get('OpenAI', 'frequency_penalty', '0.0')
-        tk.Label(frequency_frame, text=f"Current: {current_frequency} | Reduces repetition (positive values)", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        frequency_current_label = tk.Label(frequency_frame, font=('Arial', 8), bg='white', fg='gray')
+        frequency_current_label.pack(anchor='w')
         
         frequency_entry = tk.Entry(frequency_frame, font=('Arial', 10), width=20)
         frequency_entry.pack(anchor='w', pady=(2, 0))
-        frequency_entry.insert(0, current_frequency)
         
         # Stop Sequences
         stop_frame = tk.Frame(main_frame, bg='white')
         stop_frame.pack(fill=tk.X, pady=(0, 15))
         
         tk.Label(stop_frame, text="Stop Sequences:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_stop = self.config.get('OpenAI', 'stop', '')
-        tk.Label(stop_frame, text=f"Current: {current_stop if current_stop else 'None'} | Comma-separated stop words", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        stop_current_label = tk.Label(stop_frame, font=('Arial', 8), bg='white', fg='gray')
+        stop_current_label.pack(anchor='w')
         
         stop_entry = tk.Entry(stop_frame, font=('Arial', 10), width=50)
         stop_entry.pack(fill=tk.X, pady=(2, 0))
-        stop_entry.insert(0, current_stop)
+        
+        # Patterns matched on the streamed reply; the server has no parameter for them
+        stop_pattern_vars = {}
+        for name, text in (('code_block', "Stop after the first code block"), ('paragraph', "Stop after the first paragraph")):
+            stop_pattern_vars[name] = tk.BooleanVar()
+            tk.Checkbutton(
+                stop_frame,
+                text=text,
+                variable=stop_pattern_vars[name],
+                bg='white',
+                font=('Arial', 9)
+            ).pack(anchor='w', pady=(5, 0))
+        
+        # Prompt prefix caching
+        cache_frame = tk.Frame(main_frame, bg='white')
+        cache_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(cache_frame, text="Prompt Cache:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
+        cache_current_label = tk.Label(cache_frame, font=('Arial', 8), bg='white', fg='gray')
+        cache_current_label.pack(anchor='w')
+        
+        cache_entry = tk.Entry(cache_frame, font=('Arial', 10), width=20)
+        cache_entry.pack(anchor='w', pady=(2, 0))
+        
+        prewarm_var = tk.BooleanVar()
+        tk.Checkbutton(
+            cache_frame,
+            text="Pre-warm connection when the window is shown",
+            variable=prewarm_var,
+            bg='white',
+            font=('Arial', 9)
+        ).pack(anchor='w', pady=(5, 0))
+        
+        # Compare mode models
+        compare_frame = tk.Frame(main_frame, bg='white')
+        compare_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(compare_frame, text="Compare Models:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
+        tk.Label(compare_frame, text="2-4 comma-separated models; add @base_url for another endpoint", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        tk.Label(compare_frame, text="Example: gpt-4.1-mini, gpt-4.1, llama3@http://localhost:8080/v1/", font=('Arial', 8), bg='white', fg='lightgray').pack(anchor='w')
+        
+        compare_entry = tk.Entry(compare_frame, font=('Arial', 10), width=50)
+        compare_entry.pack(fill=tk.X, pady=(2, 0))
+        
+        # Retrieval of past chats
+        retrieval_frame = tk.Frame(main_frame, bg='white')
+        retrieval_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(retrieval_frame, text="Past Chat Retrieval:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
+        retrieval_note = "Sends the most relevant earlier exchanges along with each question"
+        if self.api_client.chat_index is None:
+            retrieval_note = "Requires NumPy (pip install numpy)"
+        tk.Label(retrieval_frame, text=retrieval_note, font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        
+        retrieval_var = tk.BooleanVar()
+        tk.Checkbutton(
+            retrieval_frame,
+            text="Retrieve relevant past chats",
+            variable=retrieval_var,
+            bg='white',
+            font=('Arial', 9)
+        ).pack(anchor='w', pady=(2, 0))
+        
+        tk.Label(retrieval_frame, text="Embedding model:", font=('Arial', 9), bg='white').pack(anchor='w')
+        embedding_entry = tk.Entry(retrieval_frame, font=('Arial', 10), width=30)
+        embedding_entry.pack(anchor='w', pady=(2, 0))
+        
+        # Background compaction
+        compaction_frame = tk.Frame(main_frame, bg='white')
+        compaction_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(compaction_frame, text="Compaction:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
+        tk.Label(compaction_frame, text="While idle, summarizes older turns so long chats stay fast and cheap", font=('Arial', 8), bg='white', fg='gray').pack(anchor='w')
+        
+        compaction_var = tk.BooleanVar()
+        tk.Checkbutton(
+            compaction_frame,
+            text="Summarize old turns in the background",
+            variable=compaction_var,
+            bg='white',
+            font=('Arial', 9)
+        ).pack(anchor='w', pady=(2, 0))
+        
+        tk.Label(compaction_frame, text="Summary model (blank for the chat model):", font=('Arial', 9), bg='white').pack(anchor='w')
+        compaction_model_entry = tk.Entry(compaction_frame, font=('Arial', 10), width=30)
+        compaction_model_entry.pack(anchor='w', pady=(2, 0))
         
         # Buttons
         button_frame = tk.Frame(main_frame, bg='white')
         button_frame.pack(fill=tk.X, pady=(20, 0))
         
         def save_settings():
-            # Save API key if provided
-            api_key = api_entry.get().strip()
-            if api_key:
-                self.api_client.update_api_key(api_key)
-            
-            # Save base URL
-            base_url = url_entry.get().strip()
-            if base_url:
-                if not base_url.endswith('/v1/'):
-                    if not base_url.endswith('/'):
-                        base_url += '/'
-                    base_url += 'v1/'
-                self.api_client.update_base_url(base_url)
-            
-            # Save model
-            model = model_entry.get().strip()
-            if model:
-                self.api_client.update_model(model)
-            
-            # Save advanced settings
-            try:
-                temp = float(temp_entry.get().strip())
-                if 0.0 <= temp <= 2.0:
-                    self.config.set('OpenAI', 'temperature', str(temp))
-            except ValueError:
-                pass
-            
-            try:
-                top_p = float(top_p_entry.get().strip())
-                if 0.0 <= top_p <= 1.0:
-                    self.config.set('OpenAI', 'top_p', str(top_p))
-            except ValueError:
-                pass
-            
-            try:
-                max_tokens = int(max_tokens_entry.get().strip())
-                if max_tokens > 0:
-                    self.config.set('OpenAI', 'max_tokens', str(max_tokens))
-            except ValueError:
-                pass
-            
-            try:
-                presence = float(presence_entry.get().strip())
-                if -2.0 <= presence <= 2.0:
-                    self.config.set('OpenAI', 'presence_penalty', str(presence))
-            except ValueError:
-                pass
-            
-            try:
-                frequency = float(frequency_entry.get().strip())
-                if -2.0 <= frequency <= 2.0:
-                    self.config.set('OpenAI', 'frequency_penalty', str(frequency))
-            except ValueError:
-                pass
-            
-            # Save stop sequences
-            stop_sequences = stop_entry.get().strip()
-            self.config.set('OpenAI', 'stop', stop_sequences)
+            # Write all fields to the file at once
+            with self.config.batch():
+                # Save API key if provided
+                api_key = api_entry.get().strip()
+                if api_key:
+                    self.api_client.update_api_key(api_key)
+                
+                # Save base URL
+                base_url = url_entry.get().strip()
+                if base_url:
+                    if not base_url.endswith('/v1/'):
+                        if not base_url.endswith('/'):
+                            base_url += '/'
+                        base_url += 'v1/'
+                    self.api_client.update_base_url(base_url)
+                
+                # Save model
+                model = model_entry.get().strip()
+                if model:
+                    self.api_client.update_model(model)
+                
+                # Save backend; an unchanged local model stays loaded
+                local_path = local_path_entry.get().strip()
+                if (backend_var.get(), local_path) != (self.config.get_backend(), self.config.get_local_model_path()):
+                    self.api_client.update_backend(backend_var.get(), local_path)
+                
+                # Save system prompt (may be empty)
+                system_prompt = system_text.get(1.0, tk.END).strip()
+                if system_prompt != self.config.get_system_prompt():
+                    self.config.set_system_prompt(system_prompt)
+                
+                # Save advanced settings
+                try:
+                    temp = float(temp_entry.get().strip())
+                    if 0.0 <= temp <= 2.0:
+                        self.config.set('OpenAI', 'temperature', str(temp))
+                except ValueError:
+                    pass
+                
+                try:
+                    top_p = float(top_p_entry.get().strip())
+                    if 0.0 <= top_p <= 1.0:
+                        self.config.set('OpenAI', 'top_p', str(top_p))
+                except ValueError:
+                    pass
+                
+                try:
+                    max_tokens = int(max_tokens_entry.get().strip())
+                    if max_tokens > 0:
+                        self.config.set('OpenAI', 'max_tokens', str(max_tokens))
+                except ValueError:
+                    pass
+                
+                try:
+                    presence = float(presence_entry.get().strip())
+                    if -2.0 <= presence <= 2.0:
+                        self.config.set('OpenAI', 'presence_penalty', str(presence))
+                except ValueError:
+                    pass
+                
+                try:
+                    frequency = float(frequency_entry.get().strip())
+                    if -2.0 <= frequency <= 2.0:
+                        self.config.set('OpenAI', 'frequency_penalty', str(frequency))
+                except ValueError:
+                    pass
+                
+                # Save stop sequences
+                stop_sequences = stop_entry.get().strip()
+                self.config.set('OpenAI', 'stop', stop_sequences)
+                stop_patterns = [name for name, var in stop_pattern_vars.items() if var.get()]
+                if stop_patterns != self.config.get_stop_patterns():
+                    self.config.set_stop_patterns(stop_patterns)
+                
+                if prewarm_var.get() != self.config.is_prewarm_enabled():
+                    self.config.set_prewarm_enabled(prewarm_var.get())
+                
+                # Save compare models
+                compare_models = compare_entry.get().strip()
+                if compare_models != self.config.get_compare_models():
+                    self.config.set_compare_models(compare_models)
+                
+                # Save retrieval settings
+                if retrieval_var.get() != self.config.is_retrieval_enabled():
+                    self.config.set_retrieval_enabled(retrieval_var.get())
+                embedding_model = embedding_entry.get().strip()
+                if embedding_model and embedding_model != self.config.get_embedding_model():
+                    self.config.set_embedding_model(embedding_model)
+                
+                # Save compaction settings
+                if compaction_var.get() != self.config.is_compaction_enabled():
+                    self.config.set_compaction_enabled(compaction_var.get())
+                compaction_model = compaction_model_entry.get().strip()
+                if compaction_model != self.config.get_compaction_model():
+                    self.config.set_compaction_model(compaction_model)
+                
+                # Save prompt cache mode
+                cache_mode = cache_entry.get().strip().lower()
+                if cache_mode in ('auto', 'openai', 'llamacpp', 'off'):
+                    self.config.set_prefix_cache_mode(cache_mode)
             
-            settings_window.destroy()
+            self._hide_secondary_window(settings_window)
             messagebox.showinfo("Success", "LLM settings updated successfully!")
         
         def cancel_settings():
-            settings_window.destroy()
+            self._hide_secondary_window(settings_window)
         
         tk.Button(button_frame, text="Save", command=save_settings, bg='#4CAF50', fg='white', font=('Arial', 10), padx=20).pack(side=tk.RIGHT, padx=(10, 0))
         tk.Button(button_frame, text="Cancel", command=cancel_settings, bg='#f44336', fg='white', font=('Arial', 10), padx=20).pack(side=tk.RIGHT)
@@ -886,17 +1404,74 @@ class GhostPad:
                 bind_to_mousewheel(child)
         
         bind_to_mousewheel(scrollable_frame)
+        
+        def refresh():
+            """Load the current settings into the widgets"""
+            current_key = self.config.get_api_key()
+            masked_key = f"{'*' * max(0, len(current_key) - 4)}{current_key[-4:]}" if current_key else "Not set"
+            current_stop = self.config.get('OpenAI', 'stop', '')
+            labels = (
+                (key_current_label, f"Current: {masked_key}"),
+                (url_current_label, f"Current: {self.config.get_base_url()}"),
+                (model_current_label, f"Current: {self.config.get_model()}"),
+                (temp_current_label, f"Current: {self.config.get('OpenAI', 'temperature', '1.0')} | Controls randomness"),
+                (top_p_current_label, f"Current: {self.config.get('OpenAI', 'top_p', '1.0')} | Limits randomness range"),
+                (max_tokens_current_label, f"Current: {self.config.get('OpenAI', 'max_tokens', '4096')} | Maximum response length"),
+                (presence_current_label, f"Current: {self.config.get('OpenAI', 'presence_penalty', '0.0')} | Encourages new topics (positive values)"),
+                (frequency_current_label, f"Current: {self.config.get('OpenAI', 'frequency_penalty', '0.0')} | Reduces repetition (positive values)"),
+                (stop_current_label, f"Current: {current_stop if current_stop else 'None'} | Comma-separated stop words"),
+                (cache_current_label, f"Current: {self.config.get_prefix_cache_mode()} | auto, openai, llamacpp or off"),
+            )
+            for label, text in labels:
+                label.config(text=text)
+            
+            entries = (
+                (api_entry, ''),
+                (url_entry, self.config.get_base_url()),
+                (model_entry, self.config.get_model()),
+                (local_path_entry, self.config.get_local_model_path()),
+                (temp_entry, self.config.get('OpenAI', 'temperature', '1.0')),
+                (top_p_entry, self.config.get('OpenAI', 'top_p', '1.0')),
+                (max_tokens_entry, self.config.get('OpenAI', 'max_tokens', '4096')),
+                (presence_entry, self.config.get('OpenAI', 'presence_penalty', '0.0')),
+                (frequency_entry, self.config.get('OpenAI', 'frequency_penalty', '0.0')),
+                (stop_entry, current_stop),
+                (cache_entry, self.config.get_prefix_cache_mode()),
+                (compare_entry, self.config.get_compare_models()),
+                (embedding_entry, self.config.get_embedding_model()),
+                (compaction_model_entry, self.config.get_compaction_model()),
+            )
+            for entry, value in entries:
+                entry.delete(0, tk.END)
+                entry.insert(0, value)
+            
+            system_text.delete(1.0, tk.END)
+            system_text.insert(1.0, self.config.get_system_prompt())
+            backend_var.set(self.config.get_backend())
+            prewarm_var.set(self.config.is_prewarm_enabled())
+            stop_patterns = self.config.get_stop_patterns()
+            for name, var in stop_pattern_vars.items():
+                var.set(name in stop_patterns)
+            retrieval_var.set(self.config.is_retrieval_enabled())
+            compaction_var.set(self.config.is_compaction_enabled())
+            profile = self.config.get_active_profile()
+            settings_window.title(f"Settings - {profile}" if profile else "Settings")
+            canvas.yview_moveto(0)
+        
+        return refresh
     
     def set_hotkeys(self):
         """Show dialog to set all hotkeys"""
-        hotkey_window = tk.Toplevel(self.root)
+        self._show_secondary_window('hotkeys', self._build_hotkey_settings, modal=True)
+    
+    def _build_hotkey_settings(self, hotkey_window):
+        """Build the hotkey settings window and return its refresh callback"""
         self.set_window_icon(hotkey_window)
         hotkey_window.title("Hotkey Settings")
         hotkey_window.geometry("400x400")
         hotkey_window.configure(bg='white')
         hotkey_window.attributes('-topmost', True)
         hotkey_window.transient(self.root)
-        hotkey_window.grab_set()
         
         # Center the window
         hotkey_window.update_idletasks()
@@ -938,8 +1513,10 @@ class GhostPad:
         # Instructions
         instructions = tk.Label(
             main_frame,
-            text="Supported keys: ctrl, alt, shift, esc, space, enter, tab, a-z, 0-9, f1-f12\n"
-                 "Examples: esc, ctrl+h, alt+space, ctrl+shift+x",
+            text="Modifiers: ctrl, alt, shift, cmd/win. Keys: a-z, 0-9, f1-f20, esc, space, enter, tab,\n"
+                 "backspace, delete, insert, home, end, pageup, pagedown, up, down, left, right,\n"
+                 "playpause, nexttrack, prevtrack, volumeup, volumedown, mute, plus, comma\n"
+                 "Examples: esc, ctrl+h, alt+space, ctrl+shift+f5, chord: ctrl+k, s",
             font=('Arial', 9),
             bg='white',
             fg='gray',
@@ -952,14 +1529,13 @@ class GhostPad:
         toggle_frame.pack(fill=tk.X, pady=(0, 15))
         
         tk.Label(toggle_frame, text="Hide/Show Window:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_toggle = self.config.get_toggle_hotkey()
-        tk.Label(toggle_frame, text=f"Current: {current_toggle}", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        toggle_current_label = tk.Label(toggle_frame, font=('Arial', 9), bg='white', fg='gray')
+        toggle_current_label.pack(anchor='w')
         
         toggle_entry = tk.Entry(toggle_frame, font=('Arial', 10), width=30)
         toggle_entry.pack(anchor='w', pady=(5, 0))
-        toggle_entry.insert(0, current_toggle)
         
-        toggle_enabled_var = tk.BooleanVar(value=self.config.is_toggle_hotkey_enabled())
+        toggle_enabled_var = tk.BooleanVar()
         toggle_enabled_check = tk.Checkbutton(
             toggle_frame, 
             text="Enabled", 
@@ -974,14 +1550,13 @@ class GhostPad:
         send_frame.pack(fill=tk.X, pady=(0, 15))
         
         tk.Label(send_frame, text="Send Message:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_send = self.config.get_send_hotkey()
-        tk.Label(send_frame, text=f"Current: {current_send}", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        send_current_label = tk.Label(send_frame, font=('Arial', 9), bg='white', fg='gray')
+        send_current_label.pack(anchor='w')
         
         send_entry = tk.Entry(send_frame, font=('Arial', 10), width=30)
         send_entry.pack(anchor='w', pady=(5, 0))
-        send_entry.insert(0, current_send)
         
-        send_enabled_var = tk.BooleanVar(value=self.config.is_send_hotkey_enabled())
+        send_enabled_var = tk.BooleanVar()
         send_enabled_check = tk.Checkbutton(
             send_frame, 
             text="Enabled", 
@@ -996,14 +1571,13 @@ class GhostPad:
         terminate_frame.pack(fill=tk.X, pady=(0, 20))
         
         tk.Label(terminate_frame, text="Force Terminate Response:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_terminate = self.config.get_terminate_hotkey()
-        tk.Label(terminate_frame, text=f"Current: {current_terminate} (only works when waiting for response)", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        terminate_current_label = tk.Label(terminate_frame, font=('Arial', 9), bg='white', fg='gray')
+        terminate_current_label.pack(anchor='w')
         
         terminate_entry = tk.Entry(terminate_frame, font=('Arial', 10), width=30)
         terminate_entry.pack(anchor='w', pady=(5, 0))
-        terminate_entry.insert(0, current_terminate)
         
-        terminate_enabled_var = tk.BooleanVar(value=self.config.is_terminate_hotkey_enabled())
+        terminate_enabled_var = tk.BooleanVar()
         terminate_enabled_check = tk.Checkbutton(
             terminate_frame, 
             text="Enabled", 
@@ -1018,14 +1592,13 @@ class GhostPad:
         exit_frame.pack(fill=tk.X, pady=(0, 20))
         
         tk.Label(exit_frame, text="Exit Application:", font=('Arial', 10, 'bold'), bg='white').pack(anchor='w')
-        current_exit = self.config.get_exit_hotkey()
-        tk.Label(exit_frame, text=f"Current: {current_exit} (completely closes the application)", font=('Arial', 9), bg='white', fg='gray').pack(anchor='w')
+        exit_current_label = tk.Label(exit_frame, font=('Arial', 9), bg='white', fg='gray')
+        exit_current_label.pack(anchor='w')
         
         exit_entry = tk.Entry(exit_frame, font=('Arial', 10), width=30)
         exit_entry.pack(anchor='w', pady=(5, 0))
-        exit_entry.insert(0, current_exit)
         
-        exit_enabled_var = tk.BooleanVar(value=self.config.is_exit_hotkey_enabled())
+        exit_enabled_var = tk.BooleanVar()
         exit_enabled_check = tk.Checkbutton(
             exit_frame, 
             text="Enabled", 
@@ -1040,49 +1613,51 @@ class GhostPad:
         button_frame.pack(fill=tk.X, pady=(20, 0))
         
         def save_hotkeys():
-            # Validate and save toggle hotkey
-            toggle_hotkey = toggle_entry.get().strip().lower()
-            if toggle_hotkey and self.validate_hotkey(toggle_hotkey):
-                self.config.set_toggle_hotkey(toggle_hotkey)
-                self.config.set_toggle_hotkey_enabled(toggle_enabled_var.get())
-            elif toggle_hotkey:
-                messagebox.showerror("Error", f"Invalid toggle hotkey: {toggle_hotkey}")
-                return
-            
-            # Validate and save send hotkey
-            send_hotkey = send_entry.get().strip().lower()
-            if send_hotkey and self.validate_hotkey(send_hotkey):
-                self.config.set_send_hotkey(send_hotkey)
-                self.config.set_send_hotkey_enabled(send_enabled_var.get())
-            elif send_hotkey:
-                messagebox.showerror("Error", f"Invalid send hotkey: {send_hotkey}")
-                return
-            
-            # Validate and save terminate hotkey
-            terminate_hotkey = terminate_entry.get().strip().lower()
-            if terminate_hotkey and self.validate_hotkey(terminate_hotkey):
-                self.config.set_terminate_hotkey(terminate_hotkey)
-                self.config.set_terminate_hotkey_enabled(terminate_enabled_var.get())
-            elif terminate_hotkey:
-                messagebox.showerror("Error", f"Invalid terminate hotkey: {terminate_hotkey}")
-                return
-            
-            # Validate and save exit hotkey
-            exit_hotkey = exit_entry.get().strip().lower()
-            if exit_hotkey and self.validate_hotkey(exit_hotkey):
-                self.config.set_exit_hotkey(exit_hotkey)
-                self.config.set_exit_hotkey_enabled(exit_enabled_var.get())
-            elif exit_hotkey:
-                messagebox.showerror("Error", f"Invalid exit hotkey: {exit_hotkey}")
-                return
+            # Write all hotkeys to the file at once
+            with self.config.batch():
+                # Validate and save toggle hotkey
+                toggle_hotkey = toggle_entry.get().strip().lower()
+                if toggle_hotkey and self.validate_hotkey(toggle_hotkey):
+                    self.config.set_toggle_hotkey(toggle_hotkey)
+                    self.config.set_toggle_hotkey_enabled(toggle_enabled_var.get())
+                elif toggle_hotkey:
+                    messagebox.showerror("Error", f"Invalid toggle hotkey: {toggle_hotkey}")
+                    return
+                
+                # Validate and save send hotkey
+                send_hotkey = send_entry.get().strip().lower()
+                if send_hotkey and self.validate_hotkey(send_hotkey):
+                    self.config.set_send_hotkey(send_hotkey)
+                    self.config.set_send_hotkey_enabled(send_enabled_var.get())
+                elif send_hotkey:
+                    messagebox.showerror("Error", f"Invalid send hotkey: {send_hotkey}")
+                    return
+                
+                # Validate and save terminate hotkey
+                terminate_hotkey = terminate_entry.get().strip().lower()
+                if terminate_hotkey and self.validate_hotkey(terminate_hotkey):
+                    self.config.set_terminate_hotkey(terminate_hotkey)
+                    self.config.set_terminate_hotkey_enabled(terminate_enabled_var.get())
+                elif terminate_hotkey:
+                    messagebox.showerror("Error", f"Invalid terminate hotkey: {terminate_hotkey}")
+                    return
+                
+                # Validate and save exit hotkey
+                exit_hotkey = exit_entry.get().strip().lower()
+                if exit_hotkey and self.validate_hotkey(exit_hotkey):
+                    self.config.set_exit_hotkey(exit_hotkey)
+                    self.config.set_exit_hotkey_enabled(exit_enabled_var.get())
+                elif exit_hotkey:
+                    messagebox.showerror("Error", f"Invalid exit hotkey: {exit_hotkey}")
+                    return
             
             # Restart hotkey listener with new settings
             self.setup_hotkey()
-            hotkey_window.destroy()
+            self._hide_secondary_window(hotkey_window)
             messagebox.showinfo("Success", "Hotkeys updated successfully!")
         
         def cancel_hotkeys():
-            hotkey_window.destroy()
+            self._hide_secondary_window(hotkey_window)
         
         tk.Button(button_frame, text="Save", command=save_hotkeys, bg='#4CAF50', fg='white', font=('Arial', 10), padx=20).pack(side=tk.RIGHT, padx=(10, 0))
         tk.Button(button_frame, text="Cancel", command=cancel_hotkeys, bg='#f44336', fg='white', font=('Arial', 10), padx=20).pack(side=tk.RIGHT)
@@ -1105,32 +1680,207 @@ class GhostPad:
                 bind_to_mousewheel(child)
         
         bind_to_mousewheel(scrollable_frame)
+        
+        def refresh():
+            """Load the current hotkeys into the widgets"""
+            hotkeys = (
+                (toggle_current_label, toggle_entry, toggle_enabled_var,
+                 self.config.get_toggle_hotkey(), "", self.config.is_toggle_hotkey_enabled()),
+                (send_current_label, send_entry, send_enabled_var,
+                 self.config.get_send_hotkey(), "", self.config.is_send_hotkey_enabled()),
+                (terminate_current_label, terminate_entry, terminate_enabled_var,
+                 self.config.get_terminate_hotkey(), " (only works when waiting for response)",
+                 self.config.is_terminate_hotkey_enabled()),
+                (exit_current_label, exit_entry, exit_enabled_var,
+                 self.config.get_exit_hotkey(), " (completely closes the application)",
+                 self.config.is_exit_hotkey_enabled()),
+            )
+            for label, entry, enabled_var, current, note, enabled in hotkeys:
+                label.config(text=f"Current: {current}{note}")
+                entry.delete(0, tk.END)
+                entry.insert(0, current)
+                enabled_var.set(enabled)
+            canvas.yview_moveto(0)
+        
+        return refresh
     
     def validate_hotkey(self, hotkey_str):
         """Validate hotkey format"""
-        parts = [part.strip().lower() for part in hotkey_str.split('+')]
-        if len(parts) > 3:
-            return False
-        
-        valid_keys = ['ctrl', 'alt', 'shift', 'esc', 'space', 'enter', 'tab'] + \
-                    [chr(i) for i in range(ord('a'), ord('z')+1)] + \
-                    [str(i) for i in range(10)] + \
-                    [f'f{i}' for i in range(1, 13)] + \
-                    ['backspace']
-        
-        invalid_keys = [part for part in parts if part not in valid_keys]
-        return len(invalid_keys) == 0
+        return parse_hotkey(hotkey_str) is not None
     
     def start_new_chat(self):
         """Start a new chat session"""
         self.api_client.clear_conversation()
-        self.chat_history.clear()
+        self.api_client.index_pending_async()
+        self.text_widget.delete(1.0, tk.END)
+        self.original_text = ""
+        self.large_input = None
+        self.large_input_marker = None
+        self.attachments.clear()
+    
+    def edit_question(self, node=None):
+        """Load a question (default: the last one) for editing on a new branch forked just before it"""
+        if self.is_waiting:
+            return
+        node = self.api_client.edit_question(node)
+        if node is None:
+            return
+        branch = self.api_client.conversation.current_branch
+        self.api_client.add_note(Role.NOTICE, f"Editing question on {branch}")
+        self.text_widget.delete(1.0, tk.END)
+        self.text_widget.insert(1.0, node.content)
+        self.text_widget.configure(fg='black')
+        self.original_text = node.content
+        self.text_widget.focus_set()
+    
+    def fork_chat(self):
+        """Fork the current chat into a new branch"""
+        if self.is_waiting:
+            return
+        branch = self.api_client.fork_conversation()
+        self.api_client.add_note(Role.NOTICE, f"Forked chat into {branch}")
+    
+    def switch_branch(self, name):
+        """Switch to another chat branch and show its last reply"""
+        if self.is_waiting:
+            return
+        self.api_client.switch_branch(name)
+        self.api_client.add_note(Role.NOTICE, f"Switched to {name}")
+        
+        last_reply = self.api_client.conversation.last_node(Role.ASSISTANT)
         self.text_widget.delete(1.0, tk.END)
+        if last_reply is not None:
+            self.text_widget.insert(1.0, last_reply.content)
+        self.text_widget.configure(fg='black')
         self.original_text = ""
     
+    def compare_models(self):
+        """Send the current text to several models and show the replies side by side"""
+        if self.is_waiting:
+            return
+        message = self.text_widget.get(1.0, tk.END).strip()
+        if not message:
+            return
+        if self.api_client.backend is None:
+            messagebox.showerror("Compare Models", "API key not configured. Right-click to set your OpenAI API key.")
+            return
+        targets = self.api_client.get_compare_targets()
+        if len(targets) < 2:
+            messagebox.showinfo("Compare Models", "Set at least two models under LLM Settings > Compare Models.")
+            return
+        
+        compare_window = tk.Toplevel(self.root)
+        self.set_window_icon(compare_window)
+        compare_window.title("Compare Models")
+        width = 360 * len(targets)
+        compare_window.configure(bg='white')
+        compare_window.attributes('-topmost', True)
+        compare_window.transient(self.root)
+        
+        # Center the window
+        compare_window.update_idletasks()
+        x = (compare_window.winfo_screenwidth() // 2) - (width // 2)
+        y = (compare_window.winfo_screenheight() // 2) - (500 // 2)
+        compare_window.geometry(f"{width}x500+{x}+{y}")
+        
+        main_frame = tk.Frame(compare_window, bg='white', padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(1, weight=1)
+        
+        # Filled in by the request threads, drained by the timer below
+        pending = [deque() for _ in targets]
+        finished = {}
+        failed = {}
+        shown = set()
+        
+        def close():
+            self.api_client.terminate_current_request()
+            compare_window.destroy()
+        
+        def use_answer(index):
+            reply, _ = finished[index]
+            self.api_client.accept_comparison(message, reply, targets[index])
+            self.text_widget.delete(1.0, tk.END)
+            self.text_widget.insert(1.0, reply)
+            self.text_widget.configure(fg='black')
+            self.original_text = ""
+            close()
+        
+        panes = []
+        for index, target in enumerate(targets):
+            main_frame.columnconfigure(index, weight=1, uniform='pane')
+            tk.Label(main_frame, text=target.label, font=('Arial', 10, 'bold'), bg='white').grid(row=0, column=index, sticky='w', padx=5)
+            
+            pane_text = tk.Text(main_frame, bg='white', fg='black', font=('Arial', 10), wrap=tk.WORD, padx=8, pady=8)
+            pane_text.grid(row=1, column=index, sticky='nsew', padx=5, pady=5)
+            
+            stats_label = tk.Label(main_frame, text="waiting", font=('Arial', 8), bg='white', fg='gray')
+            stats_label.grid(row=2, column=index, sticky='w', padx=5)
+            
+            use_button = tk.Button(
+                main_frame,
+                text="Use this answer",
+                command=lambda i=index: use_answer(i),
+                bg='#4CAF50',
+                fg='white',
+                font=('Arial', 10),
+                state=tk.DISABLED
+            )
+            use_button.grid(row=3, column=index, pady=(5, 0))
+            panes.append((pane_text, stats_label, use_button))
+        
+        def flush():
+            if not compare_window.winfo_exists():
+                return
+            for index, (pane_text, stats_label, use_button) in enumerate(panes):
+                if index in shown:
+                    continue
+                if pending[index]:
+                    parts = []
+                    while pending[index]:
+                        parts.append(pending[index].popleft())
+                    pane_text.insert(tk.END, ''.join(parts))
+                    pane_text.see(tk.END)
+                    stats_label.configure(text="streaming")
+                if index in failed:
+                    pane_text.delete(1.0, tk.END)
+                    pane_text.insert(1.0, failed[index])
+                    stats_label.configure(text="failed", fg='red')
+                    shown.add(index)
+                elif index in finished:
+                    reply, stats = finished[index]
+                    pane_text.delete(1.0, tk.END)
+                    pane_text.insert(1.0, reply)
+                    stats_label.configure(
+                        text=f"first token {stats['first_token_s']:.2f}s | total {stats['total_s']:.2f}s | "
+                             f"{stats['tokens']} tok | {stats['tokens_per_s']:.0f} tok/s"
+                    )
+                    use_button.configure(state=tk.NORMAL)
+                    shown.add(index)
+                elif cancel.is_set():
+                    # Cancelled, e.g. by a new send from the pad; no more callbacks will come
+                    stats_label.configure(text="cancelled", fg='gray')
+                    shown.add(index)
+            # Keep polling only while some model is still answering
+            if len(shown) < len(panes):
+                compare_window.after(LOADING_TICK_MS, flush)
+        
+        compare_window.protocol("WM_DELETE_WINDOW", close)
+        cancel = self.api_client.compare_async(
+            message,
+            targets,
+            lambda index, text: pending[index].append(text),
+            lambda index, reply, stats: finished.__setitem__(index, (reply, stats)),
+            lambda index, error: failed.__setitem__(index, error)
+        )
+        flush()
+    
     def show_history(self):
         """Show chat history window"""
-        history_window = tk.Toplevel(self.root)
+        self._show_secondary_window('history', self._build_history)
+    
+    def _build_history(self, history_window):
+        """Build the chat history window and return its refresh callback"""
         self.set_window_icon(history_window)
         history_window.title("Chat History")
         history_window.geometry("700x500")
@@ -1150,7 +1900,11 @@ class GhostPad:
         
         # Title
         title_label = tk.Label(main_frame, text="Chat History", font=('Arial', 14, 'bold'), bg='white')
-        title_label.pack(pady=(0, 20))
+        title_label.pack(pady=(0, 5))
+        
+        # Token usage, including prompt tokens served from the provider cache
+        usage_label = tk.Label(main_frame, font=('Arial', 9), bg='white', fg='gray')
+        usage_label.pack(pady=(0, 15))
         
         # Scrollable text area
         text_frame = tk.Frame(main_frame, bg='white')
@@ -1181,14 +1935,62 @@ class GhostPad:
         history_text.tag_configure("system", foreground="#FF9800", font=('Arial', 10, 'bold'))
         history_text.tag_configure("error", foreground="#f44336", font=('Arial', 10, 'bold'))
         history_text.tag_configure("content", foreground="black", font=('Arial', 10))
+        history_text.tag_configure("edit", foreground="gray", font=('Arial', 9, 'underline'))
+        history_text.tag_bind("edit", "<Enter>", lambda e: history_text.config(cursor="hand2"))
+        history_text.tag_bind("edit", "<Leave>", lambda e: history_text.config(cursor=""))
         
-        # Populate history
-        history_text.config(state=tk.NORMAL)
-        if not self.chat_history:
-            history_text.insert(tk.END, "None")
-        else:
-            for i, (sender, message) in enumerate(self.chat_history):
-                if i > 0:
+        # Close button
+        close_button = tk.Button(
+            main_frame,
+            text="Close",
+            command=partial(self._hide_secondary_window, history_window),
+            bg='#2196F3',
+            fg='white',
+            font=('Arial', 10),
+            padx=20
+        )
+        close_button.pack(pady=(20, 0))
+        
+        # Messages currently rendered, as (node, content) pairs
+        shown = []
+        rendered = False
+        edit_tags = []  # One tag per question's edit link, bound to that question
+        
+        def refresh():
+            """Render messages added since the last refresh, or everything if the branch changed"""
+            nonlocal rendered
+            usage = self.api_client.session_usage
+            queue = self.api_client.scheduler.metrics()
+            usage_label.config(
+                text=f"Tokens this session: {usage['prompt_tokens']} prompt "
+                     f"({usage['cached_tokens']} cached), {usage['completion_tokens']} completion\n"
+                     f"Background jobs: {queue['background_queued']} queued, {queue['background_run']} run "
+                     f"(wait avg {queue['background_wait_avg_s'] * 1000:.0f} ms, max {queue['background_wait_max_s'] * 1000:.0f} ms), "
+                     f"{queue['background_preempted']} preempted"
+            )
+            
+            # History is a view of the current branch of the shared message store
+            current = [(node, node.content) for node in self.api_client.conversation.nodes()]
+            if rendered and current[:len(shown)] == shown:
+                new = current[len(shown):]
+                if not new:
+                    return
+            else:
+                new = current
+                shown.clear()
+            rendered = True
+            
+            history_text.config(state=tk.NORMAL)
+            if not shown:
+                history_text.delete(1.0, tk.END)
+                for tag in edit_tags:
+                    history_text.tag_delete(tag)
+                edit_tags.clear()
+                if not current:
+                    history_text.insert(tk.END, "None")
+            for node, message in new:
+                sender = node.role.label
+                if shown:
                     history_text.insert(tk.END, "\n" + "="*50 + "\n\n")
                 
                 # Add sender label
@@ -1196,29 +1998,32 @@ class GhostPad:
                     history_text.insert(tk.END, f"{sender}:\n", "error")
                 elif sender == "System":
                     history_text.insert(tk.END, f"{sender}:\n", "system")
+                elif node.role == Role.USER:
+                    # Any earlier question can be edited and re-asked on a new branch
+                    tag = f"edit-{len(edit_tags)}"
+                    history_text.tag_bind(tag, "<Button-1>", lambda e, n=node: self.edit_question(n))
+                    edit_tags.append(tag)
+                    history_text.insert(tk.END, f"{sender}:", sender.lower())
+                    history_text.insert(tk.END, "  edit", ("edit", tag))
+                    history_text.insert(tk.END, "\n")
                 else:
                     history_text.insert(tk.END, f"{sender}:\n", sender.lower())
                 
                 # Add message content
                 history_text.insert(tk.END, f"{message}\n", "content")
+                shown.append((node, message))
+            history_text.config(state=tk.DISABLED)
+            if new:
+                history_text.see(tk.END)
         
-        history_text.config(state=tk.DISABLED)
-        
-        # Close button
-        close_button = tk.Button(
-            main_frame,
-            text="Close",
-            command=history_window.destroy,
-            bg='#2196F3',
-            fg='white',
-            font=('Arial', 10),
-            padx=20
-        )
-        close_button.pack(pady=(20, 0))
+        return refresh
 
     def show_help(self):
         """Show help window with README content"""
-        help_window = tk.Toplevel(self.root)
+        self._show_secondary_window('help', self._build_help)
+    
+    def _build_help(self, help_window):
+        """Build the help window, rendering README.md once, and return its refresh callback"""
         self.set_window_icon(help_window)
         help_window.title("Help")
         help_window.geometry("800x600")
@@ -1281,6 +2086,9 @@ class GhostPad:
         x = (help_window.winfo_screenwidth() // 2) - (800 // 2)
         y = (help_window.winfo_screenheight() // 2) - (600 // 2)
         help_window.geometry(f"800x600+{x}+{y}")
+        
+        # The rendered README does not change while the app runs
+        return lambda: None
     
     def render_markdown(self, text_widget, markdown_content):
         """Render markdown content with basic formatting"""
@@ -1412,11 +2220,54 @@ class GhostPad:
                     else:
                         text_widget.insert(tk.END, italic_content)
     
+    def select_profile(self, name):
+        """Switch to a named profile ('' for the default settings)"""
+        if name == self.config.get_active_profile():
+            return
+        self.api_client.select_profile(name)
+        self.api_client.add_note(Role.NOTICE, f"Switched to profile {name or 'Default'}")
+        
+        # Persist the choice later, off the switching path
+        if self.profile_save_timer is not None:
+            self.root.after_cancel(self.profile_save_timer)
+        self.profile_save_timer = self.root.after(PROFILE_SAVE_DELAY_MS, self._save_profile_choice)
+        
+        if self.config.is_prewarm_enabled():
+            self.api_client.prewarm_async()
+    
+    def _save_profile_choice(self):
+        self.profile_save_timer = None
+        self.config.flush()
+    
+    def new_profile(self):
+        """Create a profile from the current settings and open it in LLM Settings"""
+        name = simpledialog.askstring("New Profile", "Profile name:", parent=self.root)
+        if name is None:
+            return
+        name = name.strip()
+        if not name or any(c in name for c in '[]'):
+            messagebox.showerror("New Profile", "Enter a name without square brackets.")
+            return
+        if name in self.config.get_profiles():
+            messagebox.showerror("New Profile", f"Profile '{name}' already exists.")
+            return
+        self.config.create_profile(name)
+        self.api_client.update_config()
+        self.select_profile(name)
+        self.show_llm_settings()
+    
     def hide_window(self):
         """Hide the window"""
         if not self.is_hidden:
             self.root.withdraw()
             self.is_hidden = True
+            
+            # A hidden pad is idle; compact now instead of waiting
+            if not self.is_waiting:
+                if self.idle_timer is not None:
+                    self.root.after_cancel(self.idle_timer)
+                    self.idle_timer = None
+                self.api_client.compact_async()
     
     def show_window(self):
         """Show the window"""
@@ -1425,6 +2276,68 @@ class GhostPad:
             self.root.lift()
             self.root.attributes('-topmost', True)
             self.is_hidden = False
+            
+            # Get the connection ready while the user types
+            if self.config.is_prewarm_enabled():
+                self.api_client.prewarm_async()
+    
+    def on_config_file_changed(self):
+        """Called from the watcher thread when config.ini may have changed"""
+        self.root.after(0, self._schedule_config_reload)
+    
+    def _schedule_config_reload(self):
+        if self.config_reload_timer is not None:
+            self.root.after_cancel(self.config_reload_timer)
+        self.config_reload_timer = self.root.after(CONFIG_RELOAD_DELAY_MS, self.reload_config)
+    
+    def reload_config(self):
+        """Reload config.ini and apply only the settings that changed.
+        
+        Saves made by the app itself reload to no changes. Settings read
+        at request time (model, sampling, prompts) need no action.
+        """
+        self.config_reload_timer = None
+        changed = self.config.reload()
+        if not changed:
+            return
+        sections = {section for section, _ in changed}
+        profiles_changed = any(section == 'Profiles' or section.startswith(PROFILE_PREFIX) for section in sections)
+        
+        if changed & CLIENT_SETTINGS or profiles_changed:
+            self.api_client.update_config()
+        
+        if 'Hotkey' in sections or profiles_changed:
+            self.setup_hotkey()
+        
+        if 'Proxy' in sections:
+            self.update_proxy()
+        
+        if 'Window' in sections:
+            try:
+                width, height, x, y = self.config.get_window_geometry()
+            except ValueError:
+                pass
+            else:
+                self.root.geometry(f"{width}x{height}+{x}+{y}")
+                self.window_geometry = [width, height, x, y]
+    
+    def update_proxy(self):
+        """Start, stop or move the local endpoint to match the settings"""
+        port = self.config.get_proxy_port() if self.config.is_proxy_enabled() else None
+        if self.proxy is not None and self.proxy.port == port:
+            return
+        if self.proxy is not None:
+            self.proxy.stop()
+            self.proxy = None
+        if port is None:
+            return
+        proxy = ProxyServer(self.api_client, port)
+        try:
+            proxy.start()
+        except OSError as e:
+            print(f"Warning: Failed to start local endpoint on port {port}: {e}")
+            return
+        self.proxy = proxy
     
     def save_window_geometry(self):
         """Save current window geometry"""
@@ -1439,8 +2352,13 @@ class GhostPad:
     def on_closing(self):
         """Handle window closing"""
         self.save_window_geometry()
+        self.config_watcher.stop()
+        if self.proxy is not None:
+            self.proxy.stop()
         if self.hotkey_listener:
             self.hotkey_listener.stop()
+        # The last exchange of the session is still being indexed
+        self.api_client.flush_index()
         self.root.quit()
         self.root.destroy()
     
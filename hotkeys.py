@@ -0,0 +1,241 @@
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from pynput.keyboard import Key, KeyCode
+
+# Logical modifier bits used in compiled hotkeys
+MOD_CTRL = 1
+MOD_ALT = 2
+MOD_SHIFT = 4
+MOD_CMD = 8
+
+CHORD_TIMEOUT_S = 1.5  # Time allowed between the steps of a chord
+
+def _keys(*names):
+    """pynput keys by name, skipping ones this platform does not define"""
+    return [getattr(Key, name) for name in names if hasattr(Key, name)]
+
+# Each physical modifier gets its own bit, so releasing one side of a
+# modifier does not clear the other side while it is still held
+_SIDE_BITS = {}
+for _bit, _names in (
+    (1, ('ctrl', 'ctrl_l')), (2, ('ctrl_r',)),
+    (4, ('alt', 'alt_l')), (8, ('alt_r', 'alt_gr')),
+    (16, ('shift', 'shift_l')), (32, ('shift_r',)),
+    (64, ('cmd', 'cmd_l')), (128, ('cmd_r',)),
+):
+    for _key in _keys(*_names):
+        _SIDE_BITS[_key] = _bit
+
+# Physical modifier state (8 bits) -> logical modifier mask
+_FOLD = [
+    (MOD_CTRL if state & 3 else 0) | (MOD_ALT if state & 12 else 0) |
+    (MOD_SHIFT if state & 48 else 0) | (MOD_CMD if state & 192 else 0)
+    for state in range(256)
+]
+
+MODIFIER_NAMES = {
+    'ctrl': MOD_CTRL, 'control': MOD_CTRL,
+    'alt': MOD_ALT, 'option': MOD_ALT,
+    'shift': MOD_SHIFT,
+    'cmd': MOD_CMD, 'win': MOD_CMD, 'super': MOD_CMD, 'meta': MOD_CMD,
+}
+
+_SPECIAL_KEY_NAMES = {
+    'esc': 'esc', 'escape': 'esc',
+    'space': 'space',
+    'enter': 'enter', 'return': 'enter',
+    'tab': 'tab',
+    'backspace': 'backspace',
+    'delete': 'delete', 'del': 'delete',
+    'insert': 'insert', 'ins': 'insert',
+    'home': 'home', 'end': 'end',
+    'pageup': 'page_up', 'pgup': 'page_up',
+    'pagedown': 'page_down', 'pgdn': 'page_down',
+    'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right',
+    'capslock': 'caps_lock', 'numlock': 'num_lock', 'scrolllock': 'scroll_lock',
+    'printscreen': 'print_screen', 'pause': 'pause', 'menu': 'menu',
+    'playpause': 'media_play_pause', 'nexttrack': 'media_next', 'prevtrack': 'media_previous',
+    'volumeup': 'media_volume_up', 'volumedown': 'media_volume_down', 'mute': 'media_volume_mute',
+}
+_SPECIAL_KEY_NAMES.update({f'f{i}': f'f{i}' for i in range(1, 21)})
+
+# Key name -> pynput key, for the keys available on this platform
+SPECIAL_KEYS = {name: getattr(Key, attr) for name, attr in _SPECIAL_KEY_NAMES.items() if hasattr(Key, attr)}
+
+# Characters that cannot be written directly in the grammar
+_CHAR_NAMES = {'plus': '+', 'comma': ','}
+
+_NO_ACTIONS: Tuple = ()
+
+def normalize_key(key):
+    """Map a pynput key to the identifier used in the hotkey table"""
+    if isinstance(key, Key):
+        return key
+    char = getattr(key, 'char', None)
+    if char:
+        if len(char) == 1 and ord(char) < 32:
+            # Ctrl+letter arrives as a control character on some platforms
+            char = chr(ord(char) + 96)
+        return char.lower()
+    vk = getattr(key, 'vk', None)
+    if vk is not None and (48 <= vk <= 57 or 65 <= vk <= 90):
+        # Letter or digit without a char (e.g. while modifiers are held on Windows)
+        return chr(vk).lower()
+    return key
+
+def _parse_step(step_str: str) -> Optional[Tuple[int, object]]:
+    """Parse one step such as 'ctrl+shift+x' into (modifier mask, trigger key)"""
+    mask = 0
+    trigger = None
+    for part in (part.strip() for part in step_str.split('+')):
+        if part in MODIFIER_NAMES:
+            mask |= MODIFIER_NAMES[part]
+            continue
+        if trigger is not None:
+            # Only one non-modifier key per step
+            return None
+        if part in SPECIAL_KEYS:
+            trigger = SPECIAL_KEYS[part]
+        elif part in _CHAR_NAMES:
+            trigger = _CHAR_NAMES[part]
+        elif len(part) == 1:
+            trigger = normalize_key(KeyCode.from_char(part))
+        else:
+            return None
+    if mask == 0 and trigger is None:
+        return None
+    return mask, trigger
+
+@lru_cache(maxsize=None)
+def parse_hotkey(hotkey_str: str) -> Optional[Tuple[Tuple[int, object], ...]]:
+    """Parse a hotkey string into a tuple of (modifier mask, trigger key) steps.
+
+    Steps are separated by commas, so 'ctrl+k, s' is a two-step chord. The
+    trigger is None for modifier-only steps such as 'ctrl+alt'. Returns None
+    if the string is not a valid hotkey. Results are cached per string.
+    """
+    steps = tuple(_parse_step(step) for step in hotkey_str.lower().split(','))
+    if None in steps or len(steps) > 2:
+        return None
+    return steps
+
+class HotkeyMatcher:
+    """Hotkey table keyed by (modifier mask, trigger key).
+
+    Hotkeys are compiled once; each key event then costs one bit operation
+    and one dict lookup, which matters because the listener sees every key
+    press in the system. The first step of a chord opens a second table
+    that is consulted for the next key press only.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, hotkey_str: str, action: Callable) -> bool:
+        """Compile a hotkey and bind it to an action"""
+        steps = parse_hotkey(hotkey_str)
+        if steps is None:
+            return False
+        if len(steps) == 1:
+            table = self.table
+        else:
+            table = self.chords.setdefault(steps[0], {})
+        table[steps[-1]] = table.get(steps[-1], _NO_ACTIONS) + (action,)
+        return True
+
+    def clear(self):
+        """Remove all hotkeys"""
+        self.table: Dict[Tuple[int, object], Tuple[Callable, ...]] = {}
+        self.chords: Dict[Tuple[int, object], Dict[Tuple[int, object], Tuple[Callable, ...]]] = {}
+        self.pressed = 0  # Physical modifier bits currently held
+        self.held = set()  # Non-modifier keys currently held
+        self.chord = None  # Second-step table while a chord is in progress
+        self.chord_deadline = 0.0
+
+    def __bool__(self) -> bool:
+        """Whether any hotkey or chord is bound"""
+        return bool(self.table or self.chords)
+
+    def press(self, key) -> Tuple[Callable, ...]:
+        """Update key state and return the actions bound to this press.
+
+        Only the initial press of a key matches; auto-repeat events while
+        a key is held return no actions.
+        """
+        bit = _SIDE_BITS.get(key)
+        if bit is not None:
+            if self.pressed & bit:
+                return _NO_ACTIONS
+            self.pressed |= bit
+            step = (_FOLD[self.pressed], None)
+        else:
+            key_id = normalize_key(key)
+            if key_id in self.held:
+                return _NO_ACTIONS
+            self.held.add(key_id)
+            step = (_FOLD[self.pressed], key_id)
+
+        if self.chord is not None:
+            if step in self.chord and time.monotonic() <= self.chord_deadline:
+                actions = self.chord[step]
+                self.chord = None
+                return actions
+            if bit is not None:
+                # Modifiers may be pressed on the way to the second step
+                return _NO_ACTIONS
+            self.chord = None
+
+        if self.chords and step in self.chords:
+            self.chord = self.chords[step]
+            self.chord_deadline = time.monotonic() + CHORD_TIMEOUT_S
+        return self.table.get(step, _NO_ACTIONS)
+
+    def release(self, key):
+        """Update key state on key release"""
+        bit = _SIDE_BITS.get(key)
+        if bit is not None:
+            self.pressed &= ~bit
+        else:
+            self.held.discard(normalize_key(key))
+
+class ActionQueue:
+    """Hands hotkey actions from the listener thread to the Tk thread.
+
+    The listener only queues; the Tk side drains the queue from its own
+    timer, so the listener thread never calls into Tk. Actions queued
+    between two drains are coalesced and run once. An action that raises
+    is passed to report, as (type, value, traceback), and the remaining
+    actions still run.
+    """
+
+    def __init__(self, report: Optional[Callable] = None):
+        self._report = report
+        self._lock = threading.Lock()
+        self._pending: Dict[Callable, None] = {}
+
+    def put(self, actions: Tuple[Callable, ...]):
+        """Queue actions (listener thread)"""
+        with self._lock:
+            for action in actions:
+                self._pending[action] = None
+
+    def drain(self):
+        """Run queued actions (Tk thread)"""
+        if not self._pending:
+            # Checked without the lock: an action queued just now runs on the next drain
+            return
+        with self._lock:
+            actions = list(self._pending)
+            self._pending.clear()
+        for action in actions:
+            try:
+                action()
+            except Exception as e:
+                # One failing action must not swallow the others
+                if self._report is not None:
+                    self._report(type(e), e, e.__traceback__)
+                else:
+                    print(f"Warning: Hotkey action failed: {e}")
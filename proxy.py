@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+from backends import LOCAL_HOSTS, BackendUnavailableError
+
+PROXY_HOST = '127.0.0.1'  # Never reachable from other machines
+COMPLETIONS_PATHS = ('/v1/chat/completions', '/chat/completions')
+MODELS_PATHS = ('/v1/models', '/models')
+
+def _plain(value: Any) -> Any:
+    """JSON-ready copy of an OpenAI response object or a local backend namespace"""
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(exclude_unset=True)
+    if isinstance(value, SimpleNamespace):
+        return {key: _plain(item) for key, item in vars(value).items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+def _response_json(response: Any, response_id: str, model: str, kind: str) -> Dict[str, Any]:
+    """Response or chunk as JSON, with the fields local backends leave out filled in"""
+    data = _plain(response)
+    data.setdefault('id', response_id)
+    data.setdefault('object', kind)
+    data.setdefault('created', int(time.time()))
+    data.setdefault('model', model)
+    for index, choice in enumerate(data.get('choices') or ()):
+        choice.setdefault('index', index)
+        choice.setdefault('finish_reason', None if kind.endswith('chunk') else 'stop')
+        if 'message' in choice:
+            choice['message'].setdefault('role', 'assistant')
+    if data.get('usage') is None:
+        data.pop('usage', None)
+    return data
+
+def _error_status(e: Exception) -> int:
+    """HTTP status to report for a failed request"""
+    if getattr(e, 'status_code', None):
+        return e.status_code
+    return 503 if isinstance(e, BackendUnavailableError) else 502
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'GhostPad'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _allowed(self) -> bool:
+        """Only local tools: web pages may not use the endpoint (and the API key behind it)"""
+        host = urlparse(f"//{self.headers.get('Host', '')}").hostname or ''
+        if self.headers.get('Origin') or host.lower() not in LOCAL_HOSTS:
+            self._send_error(403, "Only local clients may use this endpoint.")
+            return False
+        return True
+
+    def _send_json(self, status: int, data: Dict[str, Any]):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {'error': {'message': message, 'type': 'ghostpad_proxy_error'}})
+
+    def do_GET(self):
+        if not self._allowed():
+            return
+        if self.path.rstrip('/') not in MODELS_PATHS:
+            self._send_error(404, f"Unknown path: {self.path}")
+            return
+        model = self.server.client.config.get_model()
+        self._send_json(200, {'object': 'list', 'data': [{'id': model, 'object': 'model', 'owned_by': 'ghostpad'}]})
+
+    def do_POST(self):
+        if not self._allowed():
+            return
+        if self.path.rstrip('/') not in COMPLETIONS_PATHS:
+            self._send_error(404, f"Unknown path: {self.path}")
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+        except ValueError:
+            self._send_error(400, "Request body is not valid JSON.")
+            return
+        if not isinstance(body, dict) or not isinstance(body.get('messages'), list):
+            self._send_error(400, "'messages' is required.")
+            return
+
+        client = self.server.client
+        # Another tool's request is as interactive as the pad's own
+        with client.scheduler.interactive():
+            self._relay(client, body)
+
+    def _relay(self, client, body: Dict[str, Any]):
+        """Run a validated completion request and send back the reply or stream"""
+        model = body.get('model') or client.config.get_model()
+        response_id = f"ghostpad-{time.time_ns()}"
+        try:
+            result = client.proxy_request(body)
+        except Exception as e:
+            self._send_error(_error_status(e), client._describe_error(e))
+            return
+        if not body.get('stream'):
+            self._send_json(200, _response_json(result, response_id, model, 'chat.completion'))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+        try:
+            for chunk in result:
+                data = _response_json(chunk, response_id, model, 'chat.completion.chunk')
+                if not include_usage:
+                    data.pop('usage', None)
+                if not data.get('choices') and 'usage' not in data:
+                    continue
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The tool hung up; closing the stream below cancels generation
+            pass
+        except Exception as e:
+            # Headers are sent, so the error goes in the stream
+            error = {'error': {'message': client._describe_error(e), 'type': 'ghostpad_proxy_error'}}
+            try:
+                self.wfile.write(f"data: {json.dumps(error)}\n\n".encode('utf-8'))
+            except OSError:
+                pass
+        finally:
+            result.close()
+
+class ProxyServer:
+    """OpenAI-compatible endpoint on localhost, served by the app's client.
+
+    Local tools pointed at it share the app's warm connections, active
+    profile and deduplication of identical in-flight requests. Streaming
+    replies are passed through chunk by chunk. Each request runs on its
+    own thread.
+    """
+
+    def __init__(self, client, port: int):
+        self.client = client
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self):
+        """Bind the port and serve in the background; raises OSError if the port is taken"""
+        self._server = ThreadingHTTPServer((PROXY_HOST, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.client = self.client
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stop serving and release the port"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
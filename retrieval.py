@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+try:
+    # Optional: enables retrieval of relevant past chats
+    import numpy as np
+except ImportError:
+    np = None
+
+from conversation import MessageNode, Role
+
+INDEX_DIR = 'memory'
+VECTORS_FILE = 'vectors.f32'  # Raw float32 rows, one unit vector per exchange
+SNIPPETS_FILE = 'snippets.jsonl'  # One JSON record per row, same order
+META_FILE = 'index.json'  # Embedding model and dimension of the rows
+SNIPPET_CHARS = 2000  # Longest exchange text embedded and sent back as context
+CONTEXT_HEADER = "Relevant excerpts from earlier chats (may be outdated):"
+
+def exchange_text(question: str, answer: str) -> str:
+    """Text stored and embedded for one question/answer exchange"""
+    return f"User: {question}\nAI: {answer}"[:SNIPPET_CHARS]
+
+def text_digest(text: str) -> str:
+    """Identity of an exchange, used to skip ones already in the payload"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def exchanges(nodes: Sequence[MessageNode]) -> Iterator[str]:
+    """Exchange texts for each question directly followed by its answer"""
+    for question, answer in zip(nodes, nodes[1:]):
+        if question.role == Role.USER and answer.role == Role.ASSISTANT and question.in_payload:
+            yield exchange_text(question.content, answer.content)
+
+def format_context(snippets: List[str]) -> str:
+    """System message content carrying retrieved snippets"""
+    return "\n\n".join([CONTEXT_HEADER] + snippets)
+
+class ChatIndex:
+    """Vector index of past exchanges, stored under the config directory.
+
+    Vectors are appended to a flat float32 file and searched through a
+    read-only memory map, so the index is not loaded into memory and a
+    search is one matrix-vector product. Vectors are normalized on the way
+    in, which makes the dot product the cosine similarity.
+    """
+
+    def __init__(self, config_dir: Path):
+        self.path = config_dir / INDEX_DIR
+        self._lock = threading.Lock()
+        self._meta: Optional[dict] = None
+        self._snippets: Optional[List[dict]] = None
+        self._matrix = None  # Memory map of the vectors, reopened after appends
+
+    @staticmethod
+    def available() -> bool:
+        """Whether the optional NumPy dependency is installed"""
+        return np is not None
+
+    def _load(self):
+        if self._snippets is not None:
+            return
+        self._meta = {}
+        self._snippets = []
+        try:
+            self._meta = json.loads((self.path / META_FILE).read_text(encoding='utf-8'))
+            with open(self.path / SNIPPETS_FILE, encoding='utf-8') as f:
+                self._snippets = [json.loads(line) for line in f if line.strip()]
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _rows(self):
+        """Memory-mapped vectors; rows without a snippet (an interrupted append) are ignored"""
+        if self._matrix is None:
+            dim = self._meta.get('dim', 0)
+            vectors = self.path / VECTORS_FILE
+            if not dim or not vectors.exists() or vectors.stat().st_size < dim * 4:
+                return None
+            matrix = np.memmap(vectors, dtype=np.float32, mode='r')
+            self._matrix = matrix[:matrix.size // dim * dim].reshape(-1, dim)
+        return self._matrix[:len(self._snippets)]
+
+    def _reset(self, model: str, dim: int):
+        """Start an empty index for a new embedding model"""
+        self._matrix = None
+        self.path.mkdir(exist_ok=True)
+        for name in (VECTORS_FILE, SNIPPETS_FILE):
+            try:
+                os.remove(self.path / name)
+            except FileNotFoundError:
+                pass
+        self._meta = {'model': model, 'dim': dim}
+        self._snippets = []
+        (self.path / META_FILE).write_text(json.dumps(self._meta), encoding='utf-8')
+
+    @staticmethod
+    def _normalize(vectors) -> 'np.ndarray':
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def add(self, texts: List[str], vectors, model: str):
+        """Append exchanges and their embeddings"""
+        if not texts:
+            return
+        matrix = self._normalize(vectors)
+        with self._lock:
+            self._load()
+            if self._meta.get('model') != model or self._meta.get('dim') != matrix.shape[1]:
+                # Vectors from different models are not comparable
+                self._reset(model, matrix.shape[1])
+            self._matrix = None
+            with open(self.path / VECTORS_FILE, 'ab') as f:
+                f.write(matrix.tobytes())
+            records = [{'digest': text_digest(text), 'text': text} for text in texts]
+            with open(self.path / SNIPPETS_FILE, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+            self._snippets.extend(records)
+
+    def search(self, vector, model: str, top_k: int, min_score: float,
+               exclude: frozenset = frozenset()) -> List[Tuple[float, str]]:
+        """Best matching exchanges as (score, text), best first"""
+        with self._lock:
+            self._load()
+            if self._meta.get('model') != model:
+                return []
+            rows = self._rows()
+            if rows is None or not len(rows):
+                return []
+            query = self._normalize([vector])[0]
+            if query.shape[0] != rows.shape[1]:
+                return []
+            scores = rows @ query
+            # Over-fetch so excluded and duplicate rows do not leave the result short
+            count = min(len(scores), top_k + len(exclude) + top_k)
+            best = np.argpartition(-scores, count - 1)[:count]
+            best = best[np.argsort(-scores[best])]
+            results = []
+            seen = set(exclude)
+            for row in best:
+                score = float(scores[row])
+                record = self._snippets[row]
+                if score < min_score or len(results) == top_k:
+                    break
+                if record['digest'] in seen:
+                    continue
+                seen.add(record['digest'])
+                results.append((score, record['text']))
+            return results
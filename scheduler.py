@@ -0,0 +1,85 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+BACKGROUND_SLOTS = 1  # Background jobs running at once
+QUEUE_POLL_S = 0.5  # How often a queued job checks whether it was cancelled
+
+class Scheduler:
+    """Orders interactive requests ahead of background work.
+
+    Interactive requests (the pad, compare mode, the local endpoint) never
+    wait. Background jobs (compaction, pre-warm) run only when no
+    interactive request is in flight and a background slot is free, and
+    are preempted, through their cancel event, when one starts. Queue
+    depth and wait times are kept for display.
+    """
+
+    def __init__(self, background_slots: int = BACKGROUND_SLOTS):
+        self.background_slots = background_slots
+        self._cond = threading.Condition()
+        self._interactive = 0
+        self._running: List[threading.Event] = []  # Cancel events of running background jobs
+        self._waiting = 0
+        self._admitted = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._preempted = 0
+
+    @contextmanager
+    def interactive(self):
+        """Run an interactive request, preempting any background job"""
+        with self._cond:
+            self._interactive += 1
+            for cancel in self._running:
+                if not cancel.is_set():
+                    cancel.set()
+                    self._preempted += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._interactive -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def background(self, cancel: threading.Event):
+        """Queue a background job; yields whether it was admitted before being cancelled.
+
+        While the job runs, cancel is set if an interactive request starts;
+        the job should check it between steps and give up.
+        """
+        queued_at = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            while not cancel.is_set() and (self._interactive or len(self._running) >= self.background_slots):
+                self._cond.wait(QUEUE_POLL_S)
+            self._waiting -= 1
+            admitted = not cancel.is_set()
+            if admitted:
+                waited = time.monotonic() - queued_at
+                self._running.append(cancel)
+                self._admitted += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._cond:
+                    self._running.remove(cancel)
+                    self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, float]:
+        """Current queue depth and background wait times so far"""
+        with self._cond:
+            return {
+                'interactive_active': self._interactive,
+                'background_active': len(self._running),
+                'background_queued': self._waiting,
+                'background_run': self._admitted,
+                'background_preempted': self._preempted,
+                'background_wait_avg_s': self._wait_total / self._admitted if self._admitted else 0.0,
+                'background_wait_max_s': self._wait_max,
+            }
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+def payload_digest(messages: List[Dict[str, str]], stream: bool, params: Dict[str, Any]) -> str:
+    """Hash of everything sent in a request"""
+    payload = json.dumps([messages, params, stream], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def request_key(backend, messages: List[Dict[str, str]], stream: bool, params: Dict[str, Any]) -> str:
+    """Identity of a request: the backend it goes to plus a hash of its payload"""
+    return f"{id(backend)}:{payload_digest(messages, stream, params)}"
+
+def _without_usage(response):
+    """Copy of a chunk or response whose token usage was already counted by another waiter"""
+    return SimpleNamespace(choices=response.choices, usage=None)
+
+class _Flight:
+    """One upstream request and everything received from it so far"""
+    __slots__ = ('upstream', 'iterator', 'chunks', 'counted', 'response', 'done', 'error', 'reading', 'subscribers')
+
+    def __init__(self):
+        self.upstream = None  # Stream from the backend, once created
+        self.iterator = None  # Its one iterator, shared by all waiters
+        self.chunks: List[Any] = []
+        self.counted = set()  # Chunk indexes whose usage was handed out
+        self.response = None
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.reading = False  # A subscriber is waiting on the upstream for the next chunk
+        self.subscribers = 0
+
+class _FlightStream:
+    """A waiter's view of a shared stream.
+
+    Every waiter sees every chunk from the start, whenever it joined.
+    Whichever waiter runs out of chunks first reads the next one from the
+    upstream for everyone; the upstream is closed (cancelling generation)
+    only when the last waiter closes its view.
+    """
+
+    def __init__(self, group: 'SingleFlight', key: str, flight: _Flight):
+        self._group = group
+        self._key = key
+        self._flight = flight
+        self._closed = False
+
+    def __iter__(self):
+        group, flight = self._group, self._flight
+        index = 0
+        while True:
+            with group._cond:
+                while True:
+                    if index < len(flight.chunks):
+                        chunk = flight.chunks[index]
+                        if getattr(chunk, 'usage', None):
+                            # Tokens were spent once, so only one waiter records them
+                            if index in flight.counted:
+                                chunk = _without_usage(chunk)
+                            else:
+                                flight.counted.add(index)
+                        break
+                    if flight.done:
+                        if flight.error is not None:
+                            raise flight.error
+                        return
+                    if flight.iterator is not None and not flight.reading:
+                        flight.reading = True
+                        chunk = None
+                        break
+                    group._cond.wait()
+
+            if chunk is not None:
+                index += 1
+                yield chunk
+                continue
+
+            try:
+                received = next(flight.iterator)
+            except StopIteration:
+                group._finish(self._key, flight)
+                return
+            except BaseException as e:
+                group._finish(self._key, flight, e)
+                raise
+            with group._cond:
+                flight.chunks.append(received)
+                flight.reading = False
+                group._cond.notify_all()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        upstream = self._group._leave(self._key, self._flight)
+        if upstream is not None:
+            upstream.close()
+
+class SingleFlight:
+    """Coalesces identical concurrent requests into one upstream call.
+
+    A request whose backend, messages and parameters match one already in
+    flight does not go upstream; it waits for that call and gets the same
+    reply, streamed chunk by chunk. Finished requests are forgotten, so
+    this never serves a stale reply, only avoids paying twice for one.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced = 0  # Requests answered by another request's upstream call
+
+    def create(self, backend, messages: List[Dict[str, str]], stream: bool = False, **params) -> Any:
+        """Same as backend.create, shared with identical requests in flight"""
+        key = request_key(backend, messages, stream, params)
+        with self._cond:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+
+        if not stream:
+            if not leader:
+                with self._cond:
+                    while not flight.done:
+                        self._cond.wait()
+                if flight.error is not None:
+                    raise flight.error
+                return _without_usage(flight.response)
+            try:
+                flight.response = backend.create(messages, **params)
+            except BaseException as e:
+                self._finish(key, flight, e)
+                raise
+            self._finish(key, flight)
+            return flight.response
+
+        if leader:
+            try:
+                upstream = backend.create(messages, stream=True, **params)
+            except BaseException as e:
+                self._finish(key, flight, e)
+                raise
+            with self._cond:
+                flight.upstream = upstream
+                flight.iterator = iter(upstream)
+                self._cond.notify_all()
+        return _FlightStream(self, key, flight)
+
+    def _finish(self, key: str, flight: _Flight, error: Optional[BaseException] = None):
+        """Mark a flight complete; later identical requests start a new one"""
+        with self._cond:
+            flight.done = True
+            flight.error = error
+            flight.reading = False
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            self._cond.notify_all()
+
+    def _leave(self, key: str, flight: _Flight):
+        """Detach a waiter; returns the upstream to close if it was the last one"""
+        with self._cond:
+            flight.subscribers -= 1
+            if flight.subscribers:
+                return None
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            return flight.upstream
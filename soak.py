@@ -0,0 +1,282 @@
+"""Long-run soak driver for GhostPad.
+
+Runs the real app against a stub OpenAI-compatible server on localhost and
+repeats what a day of use does: thousands of turns, cancelled replies, new
+chats, secondary windows opened and closed, and the pad hidden and shown.
+RSS, traced Python heap and thread count are sampled over time; the run
+fails (exit status 1) if any of them grows past its threshold after warm-up.
+
+Needs a display for Tk and the hotkey listener; on a headless machine use
+e.g. `xvfb-run python soak.py`. The app runs with a temporary home
+directory, so the real config and history are not touched.
+
+    python soak.py --turns 5000 --max-rss-growth-mb 50
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    # Optional: accurate RSS on every platform
+    import psutil
+except ImportError:
+    psutil = None
+
+STUB_REPLY = "Soak reply with a few words in it, streamed in small pieces like a real model. " * 2
+STUB_CHUNK_CHARS = 8  # Characters per streamed chunk
+REQUEST_TIMEOUT_S = 30.0  # A turn that takes longer than this counts as hung
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers chat completions with a fixed reply, streamed or not"""
+    chunk_delay = 0.001
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._send_json({'object': 'list', 'data': [{'id': 'soak', 'object': 'model', 'owned_by': 'soak'}]})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        base = {'id': 'soak', 'created': 0, 'model': body.get('model', 'soak')}
+        usage = {'prompt_tokens': 10, 'completion_tokens': 20, 'total_tokens': 30}
+        if self.path.endswith('/embeddings'):
+            inputs = body.get('input') or []
+            data = [{'object': 'embedding', 'index': i, 'embedding': [1.0, float(len(text) % 7), 0.5]}
+                    for i, text in enumerate(inputs)]
+            self._send_json({'object': 'list', 'data': data, 'model': body.get('model'), 'usage': usage})
+            return
+        if not body.get('stream'):
+            self._send_json(dict(base, object='chat.completion', usage=usage, choices=[
+                {'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': STUB_REPLY}}
+            ]))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        try:
+            for start in range(0, len(STUB_REPLY), STUB_CHUNK_CHARS):
+                chunk = dict(base, object='chat.completion.chunk', choices=[
+                    {'index': 0, 'finish_reason': None, 'delta': {'content': STUB_REPLY[start:start + STUB_CHUNK_CHARS]}}
+                ])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(self.chunk_delay)
+            final = dict(base, object='chat.completion.chunk', choices=[], usage=usage)
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            # Cancelled by the client
+            pass
+
+def start_stub_server(chunk_delay: float) -> ThreadingHTTPServer:
+    """Serve the stub API on a free localhost port"""
+    _StubHandler.chunk_delay = chunk_delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def rss_mb() -> float:
+    """Resident set size of this process in MiB"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (IOError, OSError, ValueError):
+        # Peak, not current, but still shows growth
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def isolate_home() -> str:
+    """Point the home directory at a temporary one so the app gets a fresh config"""
+    home = tempfile.mkdtemp(prefix='ghostpad-soak-')
+    os.environ['HOME'] = home
+    os.environ['USERPROFILE'] = home
+    return home
+
+def write_config(base_url: str, args):
+    """Settings for the run: the stub endpoint and the background features under test"""
+    from config import Config
+    config = Config()
+    with config.batch():
+        config.set_api_key('soak')
+        config.set_base_url(base_url)
+        config.set_model('soak-model')
+        config.set_prefix_cache_mode('off')
+        config.set_prewarm_enabled(True)
+        config.set('OpenAI', 'prewarm_interval', '0')
+        config.set_compaction_enabled(args.compaction)
+        config.set('Compaction', 'trigger_chars', '1000')
+        config.set_retrieval_enabled(args.retrieval)
+
+class Soak:
+    """Drives one app instance through the scripted session"""
+
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.samples = []
+        self.hung = 0
+
+    def pump(self, seconds: float = 0.0, until=None) -> bool:
+        """Process Tk events for a while, or until a condition holds; returns whether it did"""
+        deadline = time.monotonic() + (seconds or REQUEST_TIMEOUT_S)
+        while time.monotonic() < deadline:
+            self.app.root.update()
+            if until is not None and until():
+                return True
+            time.sleep(0.001)
+        return until is None
+
+    def turn(self, index: int):
+        app = self.app
+        app.text_widget.delete(1.0, 'end')
+        app.text_widget.insert(1.0, f"Question {index}: what is {index} squared?")
+        app.send_message_via_hotkey()
+        if self.args.cancel_every and index % self.args.cancel_every == 0:
+            # Cancel mid-stream, after the first text arrived
+            self.pump(until=lambda: app.stream_started or not app.is_waiting)
+            app.terminate_current_request()
+        if not self.pump(until=lambda: not app.is_waiting):
+            self.hung += 1
+            app.terminate_current_request()
+            self.pump(until=lambda: not app.is_waiting)
+
+    def windows(self):
+        """Open and close each secondary window"""
+        app = self.app
+        for name, show in (('history', app.show_history), ('help', app.show_help), ('settings', app.show_llm_settings)):
+            show()
+            self.pump(0.01)
+            app._hide_secondary_window(app.secondary_windows[name][0])
+            self.pump(0.01)
+
+    def toggle(self):
+        """Hide the pad (which starts compaction) and show it again (which pre-warms)"""
+        self.app.toggle_window()
+        self.pump(0.01)
+        self.app.toggle_window()
+        self.pump(0.01)
+
+    def sample(self, index: int):
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+        self.samples.append({
+            'turn': index,
+            'rss_mb': rss_mb(),
+            'heap_mb': traced / 2 ** 20,
+            'threads': threading.active_count(),
+            'messages': len(self.app.api_client.conversation.nodes()),
+        })
+        row = self.samples[-1]
+        print(f"{row['turn']:>7} {row['rss_mb']:>9.1f} {row['heap_mb']:>9.2f} {row['threads']:>8} {row['messages']:>9}",
+              flush=True)
+
+    def run(self) -> int:
+        args = self.args
+        warmup = max(1, int(args.turns * args.warmup))
+        sample_every = max(1, args.turns // args.samples)
+        baseline = None
+        print(f"{'turn':>7} {'rss_mb':>9} {'heap_mb':>9} {'threads':>8} {'messages':>9}")
+        for index in range(1, args.turns + 1):
+            self.turn(index)
+            if args.window_every and index % args.window_every == 0:
+                self.windows()
+            if args.toggle_every and index % args.toggle_every == 0:
+                self.toggle()
+            if args.new_chat_every and index % args.new_chat_every == 0:
+                self.app.start_new_chat()
+            if index == warmup:
+                self.pump(args.settle)
+                self.sample(index)
+                baseline = tracemalloc.take_snapshot()
+            elif index % sample_every == 0:
+                self.sample(index)
+
+        # Let request threads and timers finish before the final measurement
+        self.pump(args.settle)
+        self.sample(args.turns)
+        return self.report(baseline)
+
+    def report(self, baseline) -> int:
+        args = self.args
+        start = next(row for row in self.samples if row['turn'] == max(1, int(args.turns * args.warmup)))
+        end = self.samples[-1]
+        print("\nTop allocators since warm-up:")
+        for stat in tracemalloc.take_snapshot().compare_to(baseline, 'lineno')[:args.top]:
+            print(f"  {stat}")
+
+        failures = []
+        if end['rss_mb'] - start['rss_mb'] > args.max_rss_growth_mb:
+            failures.append(f"RSS grew {end['rss_mb'] - start['rss_mb']:.1f} MiB (limit {args.max_rss_growth_mb})")
+        if end['heap_mb'] - start['heap_mb'] > args.max_heap_growth_mb:
+            failures.append(f"Python heap grew {end['heap_mb'] - start['heap_mb']:.2f} MiB (limit {args.max_heap_growth_mb})")
+        if end['threads'] - start['threads'] > args.max_thread_growth:
+            failures.append(f"Thread count grew from {start['threads']} to {end['threads']} (limit +{args.max_thread_growth})")
+        if self.hung:
+            failures.append(f"{self.hung} turns did not finish within {REQUEST_TIMEOUT_S:.0f} s")
+
+        print()
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if not failures:
+            print("PASS: no growth beyond thresholds")
+        return 1 if failures else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Soak-test GhostPad against a local stub API.")
+    parser.add_argument('--turns', type=int, default=2000, help="questions to send")
+    parser.add_argument('--cancel-every', type=int, default=7, help="cancel every Nth reply mid-stream (0: never)")
+    parser.add_argument('--window-every', type=int, default=5, help="open and close the secondary windows every N turns")
+    parser.add_argument('--toggle-every', type=int, default=3, help="hide and show the pad every N turns")
+    parser.add_argument('--new-chat-every', type=int, default=50,
+                        help="start a new chat every N turns (0: one ever-growing chat)")
+    parser.add_argument('--compaction', action='store_true', help="enable background compaction")
+    parser.add_argument('--retrieval', action='store_true', help="enable past chat retrieval (needs numpy)")
+    parser.add_argument('--chunk-delay', type=float, default=0.001, help="stub server delay between chunks, seconds")
+    parser.add_argument('--warmup', type=float, default=0.1, help="fraction of turns before the baseline is taken")
+    parser.add_argument('--samples', type=int, default=20, help="measurements taken over the run")
+    parser.add_argument('--settle', type=float, default=2.0, help="seconds to let threads finish before measuring")
+    parser.add_argument('--top', type=int, default=10, help="allocators listed in the report")
+    parser.add_argument('--max-rss-growth-mb', type=float, default=50.0)
+    parser.add_argument('--max-heap-growth-mb', type=float, default=10.0)
+    parser.add_argument('--max-thread-growth', type=int, default=4)
+    args = parser.parse_args()
+
+    # Help and resources are looked up relative to the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    home = isolate_home()
+    server = start_stub_server(args.chunk_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1/"
+    print(f"Stub API at {base_url}, home at {home}")
+
+    tracemalloc.start()
+    write_config(base_url, args)
+    from ghostpad import GhostPad
+    app = GhostPad()
+    try:
+        return Soak(app, args).run()
+    finally:
+        app.on_closing()
+        server.shutdown()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Named patterns for stops that servers have no parameter for:
+# name -> (text, occurrence that stops, whether the text itself is kept)
+STOP_PATTERNS = {
+    'code_block': ("```", 2, True),  # Stop once the first fenced code block is closed
+    'paragraph': ("\n\n", 1, False),  # Stop at the end of the first paragraph
+}
+
+class StopAutomaton:
+    """Aho-Corasick automaton over stop patterns, compiled once per pattern set.
+
+    Each character of the stream costs a few dict lookups however many
+    patterns there are, and matches that span stream chunks are found
+    because the state carries over between chunks.
+    """
+
+    def __init__(self, patterns: Tuple[Tuple[str, int, bool], ...]):
+        self.patterns = patterns
+        self.goto: List[Dict[str, int]] = [{}]
+        self.depth = [0]  # Length of the pattern prefix each state stands for
+        outputs: List[List[int]] = [[]]
+        for index, (text, _, _) in enumerate(patterns):
+            state = 0
+            for char in text:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.depth.append(self.depth[state] + 1)
+                    outputs.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            outputs[state].append(index)
+
+        # Failure links in breadth-first order, merging outputs along them
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                outputs[child].extend(outputs[self.fail[child]])
+        self.outputs = [tuple(output) for output in outputs]
+
+@lru_cache(maxsize=16)
+def compile_stops(sequences: Tuple[str, ...], named: Tuple[str, ...]) -> Optional[StopAutomaton]:
+    """Automaton for literal stop sequences plus named patterns, or None if there are none"""
+    patterns = tuple((sequence, 1, False) for sequence in sequences if sequence)
+    patterns += tuple(STOP_PATTERNS[name] for name in named if name in STOP_PATTERNS)
+    return StopAutomaton(patterns) if patterns else None
+
+class StopMatcher:
+    """Runs a stop automaton over a streamed reply.
+
+    Text that could still turn out to be the start of a stop sequence is
+    held back, so a stop sequence never reaches the screen even when it
+    arrives split across chunks. Occurrences of a pattern are counted
+    only when they do not overlap, so a four-backtick fence is one fence.
+    """
+
+    def __init__(self, automaton: StopAutomaton):
+        self.automaton = automaton
+        self.state = 0
+        self.held = ''
+        self.offset = 0  # Stream position of the first held character
+        self.counts = [0] * len(automaton.patterns)
+        self.counted_end = [0] * len(automaton.patterns)  # Stream position after each pattern's last counted match
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        """Consume a chunk; returns the text that is safe to show and whether to stop"""
+        automaton = self.automaton
+        goto, fail = automaton.goto, automaton.fail
+        buffer = self.held + text
+        state = self.state
+        for position in range(len(self.held), len(buffer)):
+            char = buffer[position]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in automaton.outputs[state]:
+                pattern, occurrence, keep = automaton.patterns[index]
+                end = self.offset + position + 1
+                if end - len(pattern) < self.counted_end[index]:
+                    # Overlaps the match already counted
+                    continue
+                self.counted_end[index] = end
+                self.counts[index] += 1
+                if self.counts[index] >= occurrence:
+                    end = position + 1
+                    self.held = ''
+                    return buffer[:end if keep else end - len(pattern)], True
+        self.state = state
+        split = len(buffer) - automaton.depth[state]
+        self.held = buffer[split:]
+        self.offset += split
+        return buffer[:split], False
+
+    def flush(self) -> str:
+        """Text still held back when the stream ended"""
+        held, self.held = self.held, ''
+        return held
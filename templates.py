@@ -0,0 +1,85 @@
+import configparser
+from pathlib import Path
+from string import Formatter
+from typing import Callable, Dict, List, Optional, Tuple
+
+TEMPLATES_FILE = 'templates.ini'
+TEMPLATE_FIELDS = ('selection', 'clipboard', 'text')
+
+DEFAULT_TEMPLATES = """\
+# GhostPad prompt templates.
+# Each section is one template. Placeholders:
+#   {selection}  selected text (pad selection, else the system selection, else the clipboard)
+#   {clipboard}  clipboard text
+#   {text}       current text in the pad
+# Optional hotkey uses the same syntax as Set Hotkeys, e.g. ctrl+alt+t or ctrl+k, t
+
+[Translate to English]
+template = Translate to English:
+
+    {selection}
+hotkey =
+
+[Explain]
+template = Explain this briefly:
+
+    {selection}
+hotkey =
+"""
+
+class PromptTemplate:
+    """Template compiled once into literal text and placeholder names"""
+    __slots__ = ('name', 'hotkey', 'parts', 'fields')
+
+    def __init__(self, name: str, source: str, hotkey: str = ''):
+        self.name = name
+        self.hotkey = hotkey
+        # Formatter.parse also resolves {{ and }} escapes
+        self.parts: Tuple[Tuple[str, Optional[str]], ...] = tuple(
+            (literal, field) for literal, field, _, _ in Formatter().parse(source)
+        )
+        self.fields = frozenset(field for _, field in self.parts if field)
+        unknown = self.fields.difference(TEMPLATE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown placeholder in template '{name}': {', '.join(sorted(unknown))}")
+
+    def render(self, sources: Dict[str, Callable[[], str]]) -> str:
+        """Fill the template, fetching only the values it actually uses"""
+        values = {field: sources[field]() for field in self.fields}
+        return ''.join(literal + (values[field] if field else '') for literal, field in self.parts).strip()
+
+def templates_path(config_dir: Path) -> Path:
+    """Location of the templates file"""
+    return config_dir / TEMPLATES_FILE
+
+def ensure_templates_file(config_dir: Path) -> Path:
+    """Create the templates file with examples if it does not exist"""
+    path = templates_path(config_dir)
+    if not path.exists():
+        try:
+            path.write_text(DEFAULT_TEMPLATES, encoding='utf-8')
+        except (IOError, OSError) as e:
+            print(f"Warning: Failed to create templates file: {e}")
+    return path
+
+def load_templates(config_dir: Path) -> List[PromptTemplate]:
+    """Load and compile all templates; invalid entries are skipped with a warning"""
+    path = ensure_templates_file(config_dir)
+    # No interpolation, so '%' in prompts is taken literally
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        parser.read(path, encoding='utf-8')
+    except (IOError, OSError, configparser.Error) as e:
+        print(f"Warning: Failed to load templates file: {e}")
+        return []
+
+    templates = []
+    for name in parser.sections():
+        source = parser.get(name, 'template', fallback='')
+        if not source.strip():
+            continue
+        try:
+            templates.append(PromptTemplate(name, source, parser.get(name, 'hotkey', fallback='').strip()))
+        except ValueError as e:
+            print(f"Warning: {e}")
+    return templates